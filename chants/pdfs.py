@@ -0,0 +1,105 @@
+import hashlib
+import json
+import re
+
+from django.shortcuts import get_object_or_404
+from fpdf import FPDF_VERSION
+from fpdf.enums import Align, XPos, YPos
+from fpdf.fonts import FontFace
+
+from dates.pdfs import PDF
+from dates.utils import format_date_or_time, striptags
+
+from .models import Sheet, SheetBlock
+
+
+def html_to_text(html: str) -> str:
+    """Convert the HTML of the editor to text, keeping the paragraphs and the line breaks."""
+    return striptags(re.sub(r"<br\s*/?>|</p>", "\n", html)).strip()
+
+
+def load_sheet(pk) -> tuple[Sheet, list[SheetBlock]]:
+    """Return a sheet and its blocks, with their songs loaded in the same query."""
+    sheet = get_object_or_404(Sheet, pk=pk)
+    return sheet, list(SheetBlock.objects.filter(sheet=sheet).select_related("song").order_by("order", "pk"))
+
+
+def get_verses(block: SheetBlock) -> list[tuple[str, str]]:
+    """
+    Return the parts of a song block, in order: `("chorus", text)` or `("<number>.", text)`.
+
+    The chorus is sung before the verses, or after the first one if `chorus_after` is set.
+    All the verses are used if none is selected.
+    """
+    song = block.song
+    indexes = [i for i in block.selected_verses if 0 <= i < len(song.verses)] or range(len(song.verses))
+    parts = [(f"{i + 1}.", song.verses[i]) for i in indexes]
+    if song.chorus:
+        parts.insert(1 if song.chorus_after and parts else 0, ("R/", song.chorus))
+    return parts
+
+
+class SheetPDF(PDF):
+    """Renders the song sheet of a mass."""
+
+    document_name = "sheet"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+
+    @classmethod
+    def load_arguments(cls, pk):
+        return load_sheet(pk), {}
+
+    @classmethod
+    def get_versioned_key(cls, sheet: Sheet, blocks: list[SheetBlock]):
+        # The version of a sheet is the hash of everything that is printed on it,
+        # so that only the changes of this sheet (or of its songs) give a new key
+        data = [
+            sheet.name,
+            str(sheet.date),
+            sheet.header_info,
+            [
+                (
+                    block.block_type,
+                    block.title,
+                    block.content,
+                    block.selected_verses,
+                    block.song and (block.song.title, block.song.chorus, block.song.verses, block.song.chorus_after),
+                )
+                for block in blocks
+            ],
+        ]
+        key = hashlib.sha1(f"sheet:{json.dumps(data)}:{FPDF_VERSION}".encode()).hexdigest()
+        return key, None
+
+    def render(self, sheet: Sheet, blocks: list[SheetBlock]):
+        self.set_title(sheet.name)
+        self.add_page()
+
+        with self.use_font_face(FontFace(emphasis="B", size_pt=2 * self.font_size_pt)):
+            self.multi_cell(0, self.font_size * 1.25, sheet.name, align=Align.C, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        date = striptags(format_date_or_time(sheet.date, year=True)).capitalize()
+        self.cell(0, self.font_size * 1.5, date, align=Align.C, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        if sheet.header_info:
+            with self.use_font_face(FontFace(emphasis="I")):
+                self.multi_cell(0, self.font_size * 1.25, sheet.header_info, align=Align.C, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.ln()
+
+        line_height = self.font_size * 1.25
+        self.start_columns(ncols=2)
+        for block in blocks:
+            title = block.title or (block.song.title if block.song else "")
+            if title:
+                with self.use_font_face(FontFace(emphasis="BU")):
+                    self.multi_cell(0, line_height, title, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+            if block.block_type == "song" and block.song:
+                for label, text in get_verses(block):
+                    with self.use_font_face(FontFace(emphasis="B" if label == "R/" else "")):
+                        self.multi_cell(0, line_height, f"{label} {text.strip()}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+                    self.ln(line_height / 2)
+            elif block.content:
+                self.multi_cell(0, line_height, html_to_text(block.content), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.ln()
+        self.end_columns()
@@ -1,3 +1,71 @@
-from django.test import TestCase
+import datetime as dt
+from io import BytesIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import Client, TestCase
+from pypdf import PdfReader
+
+from dates.tests import TestFontsMixin
+
+from .models import Sheet, SheetBlock, Song, SongCategory
+from .pdfs import SheetPDF, get_verses, html_to_text, load_sheet
+
+
+class SheetTests(TestFontsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.song = Song.objects.create(
+            title="Peuple de Dieu",
+            category=SongCategory.objects.create(name="Entrée"),
+            chorus="Peuple de Dieu, marche joyeux",
+            verses=["Premier couplet", "Deuxième couplet", "Troisième couplet"],
+        )
+        self.sheet = Sheet.objects.create(name="Messe de l'Épiphanie", date=dt.date(2026, 1, 4))
+        SheetBlock.objects.create(sheet=self.sheet, order=1, block_type="song", song=self.song, selected_verses=[0, 2])
+        SheetBlock.objects.create(sheet=self.sheet, order=0, block_type="text", title="Accueil", content="<p>Bienvenue</p>")
+
+    def test_verses(self):
+        block = SheetBlock(block_type="song", song=self.song, selected_verses=[0, 2, 7])
+        self.assertEqual(
+            get_verses(block),
+            [("R/", "Peuple de Dieu, marche joyeux"), ("1.", "Premier couplet"), ("3.", "Troisième couplet")],
+        )
+        self.song.chorus_after = True
+        block.selected_verses = []
+        self.assertEqual([label for label, _text in get_verses(block)], ["1.", "R/", "2.", "3."])
+
+    def test_html_to_text(self):
+        self.assertEqual(html_to_text("<p>Un<br>deux</p><p>trois &amp; quatre</p>"), "Un\ndeux\ntrois & quatre")
+
+    def test_load_sheet(self):
+        with self.assertNumQueries(2):
+            sheet, blocks = load_sheet(self.sheet.pk)
+            self.assertEqual(sheet, self.sheet)
+            self.assertEqual([block.block_type for block in blocks], ["text", "song"])
+            self.assertEqual(blocks[1].song.title, "Peuple de Dieu")
+
+    def test_versioned_key(self):
+        key = SheetPDF.get_versioned_key(*load_sheet(self.sheet.pk))
+        self.assertEqual(SheetPDF.get_versioned_key(*load_sheet(self.sheet.pk)), key)
+        # The songs are printed on the sheet, their changes give a new key
+        self.song.verses[1] = "Autre couplet"
+        self.song.save()
+        self.assertNotEqual(SheetPDF.get_versioned_key(*load_sheet(self.sheet.pk)), key)
+
+    def test_missing_sheet(self):
+        self.assertEqual(Client(HTTP_HOST="localhost").get("/sheets/0/pdf").status_code, 404)
+
+    def test_pdf(self):
+        client = Client(HTTP_HOST="localhost")
+        # The sheet and its blocks are only loaded once
+        with self.assertNumQueries(2):
+            response = client.get(f"/sheets/{self.sheet.pk}/pdf")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        text = "".join(page.extract_text() for page in PdfReader(BytesIO(response.content)).pages)
+        for expected in ("Messe de l'Épiphanie", "Bienvenue", "Peuple de Dieu", "3. Troisième couplet"):
+            self.assertIn(expected, text)
+        self.assertNotIn("Deuxième couplet", text)
+
+        response = client.get(f"/sheets/{self.sheet.pk}/pdf", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
@@ -1,6 +1,8 @@
 from django.urls import path
+from .pdfs import SheetPDF
 from .views import edit
 
 urlpatterns = [
     path("edit-songs", edit),
+    path("sheets/<int:pk>/pdf", SheetPDF.as_view()),
 ]
@@ -11,8 +11,11 @@ from django.utils.formats import get_format
 from django.utils.translation import gettext_lazy as _
 from solo.admin import SingletonModelAdmin
 
+from .caldav import get_date_changes, record_changes
 from .forms import get_occurrences_form_for
 from .models import Bulletin, Celebrant, Config, Date, FixedFeast, MovableFeast, Recurrence, Week
+from .occurrences import iter_occurrences
+from .versions import bump_version
 
 
 @admin.register(Bulletin)
@@ -35,12 +38,17 @@ class OccurrencesMixin:
         """Retourne les occurrences d'un événement sous forme de JSON."""
         Form = self.get_form(request, change=True)
         Form.validate_unique = lambda *_, **__: None
-        form = Form(request.POST)
+        # The stored object keeps the fields that are not in the form (e.g. the anchor of the rules)
+        instance = self.get_object(request, request.GET["object_id"]) if request.GET.get("object_id") else None
+        form = Form(request.POST, instance=instance)
         if not form.is_valid():
             return JsonResponse({"invalid": True, "errors": form.errors.get_json_data()}, status=400)
         obj = form.instance
         try:
-            occurrences = obj.get_occurrences(Week.get_current().start) if obj else []
+            occurrences = obj.get_occurrences(
+                Week.get_current().start,
+                cursor=request.POST.get("cursor") or request.GET.get("cursor"),
+            ) if obj else []
         except (KeyError, ValueError) as err:
             if str(err) == "year 10000 is out of range":
                 raise
@@ -51,6 +59,7 @@ class OccurrencesMixin:
         return JsonResponse({
             "occurrences": [str(occurrence) for occurrence in occurrences],
             "ended": getattr(occurrences, "ended", True),
+            "cursor": getattr(occurrences, "cursor", None),
         })
 
 
@@ -138,14 +147,17 @@ class DateAdmin(admin.ModelAdmin):
 
 
         Date.objects.bulk_create(dates)
+        # bulk_create() doesn't send the post_save signal
+        bump_version(Date._meta.label)
+        record_changes(name for date in dates for name in get_date_changes(date))
 
         if request.headers.get("Accept") == "application/json":
             return JsonResponse({"success": True})
 
         return redirect("admin:dates_date_changelist")
 
-    def changelist_view(self, *args, **kwargs):
-        ret = super().changelist_view(*args, **kwargs)
+    def changelist_view(self, request, *args, **kwargs):
+        ret = super().changelist_view(request, *args, **kwargs)
 
         # If we're not on the objects list (e.g. the delete page), stop here
         if "cl" not in getattr(ret, "context_data", {}):
@@ -164,21 +176,9 @@ class DateAdmin(admin.ModelAdmin):
         ret.context_data['next_week_link'] = cl.get_query_string({self.list_filter[0].parameter_name: str(next_week)})
 
         # Get all events
-        events = Recurrence.objects.all()
-        occurrences = []
-        for event in events:
-            occurrences.extend(event.get_occurrences(current_week))
-        result_list = ret.context_data["cl"].result_list
-
         occurrences = [
-            occurrence
-            for occurrence in occurrences
-            if not any(
-                result.event == occurrence.event and result.start_date == occurrence.start_date
-                for result in result_list
-            )
+            *iter_occurrences(current_week, queryset=self.get_queryset(request), include_stored=False, feasts=False)
         ]
-        occurrences.sort(key=lambda occurrence: (occurrence.start_date, occurrence.start_time))
         ret.context_data["occurrences_form"] = get_occurrences_form_for(occurrences)
 
         # Add the occurrences to the context
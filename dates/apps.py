@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
 
 from .migration_helpers import create_movable_feasts
 
@@ -9,7 +9,58 @@ class DatesConfig(AppConfig):
     name = "dates"
 
     def ready(self):
+        from .cache import invalidate_rule_cache
+        from .caldav import record_calendar_change, remember_previous_event
+        from .occurrences import materialize_recurrence
+        from .pdfs import invalidate_header
+        from .versions import VERSIONED_MODELS, bump_data_version
+
         post_migrate.connect(
             create_movable_feasts,
             dispatch_uid="dates.migration_helpers.create_movable_feasts",
         )
+
+        for model_name in ("FixedFeast", "Recurrence"):
+            model = self.get_model(model_name)
+            for signal in (post_save, post_delete):
+                signal.connect(
+                    invalidate_rule_cache,
+                    sender=model,
+                    dispatch_uid=f"dates.cache.invalidate_rule_cache.{model_name}",
+                )
+
+        post_save.connect(
+            materialize_recurrence,
+            sender=self.get_model("Recurrence"),
+            dispatch_uid="dates.occurrences.materialize_recurrence",
+        )
+
+        for signal in (post_save, post_delete):
+            signal.connect(
+                invalidate_header,
+                sender=self.get_model("Config"),
+                dispatch_uid="dates.pdfs.invalidate_header",
+            )
+
+        pre_save.connect(
+            remember_previous_event,
+            sender=self.get_model("Date"),
+            dispatch_uid="dates.caldav.remember_previous_event",
+        )
+        for model_name in ("Date", "Recurrence"):
+            model = self.get_model(model_name)
+            for signal in (post_save, post_delete):
+                signal.connect(
+                    record_calendar_change,
+                    sender=model,
+                    dispatch_uid=f"dates.caldav.record_calendar_change.{model_name}",
+                )
+
+        for model_name in VERSIONED_MODELS:
+            model = self.get_model(model_name)
+            for signal in (post_save, post_delete):
+                signal.connect(
+                    bump_data_version,
+                    sender=model,
+                    dispatch_uid=f"dates.versions.bump_data_version.{model_name}",
+                )
@@ -0,0 +1,166 @@
+"""
+Rendering of several weeks of bulletins at once.
+
+The weeks are rendered in parallel in a pool of worker processes. The workers are started
+with `spawn` (nothing is inherited from the web process: database connections, locks...),
+so this module must stay importable before Django is set up: the Django imports are done
+in the functions.
+
+Each worker loads the fonts and the logo once, when it starts, and keeps them for all
+the weeks it renders.
+"""
+
+import datetime as dt
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator
+
+# Maximum number of weeks in a bundle
+MAX_WEEKS = 53
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(settings_module: str):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+
+    import django
+
+    django.setup()
+
+    from .pdfs import PDF, get_header
+    from .pdfs.fonts import STYLES
+
+    # Load the fonts and the logo once per worker
+    pdf = PDF()
+    for style in STYLES:
+        pdf.set_font(style=style)
+    get_header()
+
+
+def _render_week(week: str) -> tuple[str, bytes]:
+    from .pdfs.feuille_annonces import FeuilleAnnonces
+
+    # The header checks the version of the configuration, which may have been saved in another process
+    return week, FeuilleAnnonces.get_document(week)
+
+
+def create_pool(max_workers: int | None = None) -> ProcessPoolExecutor:
+    """Start a pool of processes that render the bulletins."""
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(os.environ["DJANGO_SETTINGS_MODULE"],),
+    )
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the shared pool of processes of this process (started on the first use)."""
+    global _pool
+
+    from django.conf import settings
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = create_pool(getattr(settings, "PDF_BUNDLE_WORKERS", 2))
+        return _pool
+
+
+def _reset_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_weeks(start: dt.date, end: dt.date) -> list[str]:
+    """Return the weeks between the week of `start` and the week of `end` (included)."""
+    from .models import Week
+
+    first = Week(start)
+    count = (Week(end) - first).days // 7 + 1
+    if count < 1:
+        raise ValueError("The end must be after the start")
+    if count > MAX_WEEKS:
+        raise ValueError(f"A bundle can't contain more than {MAX_WEEKS} weeks")
+    return [str(first + dt.timedelta(weeks=i)) for i in range(count)]
+
+
+def iter_rendered_weeks(weeks: list[str], pool: ProcessPoolExecutor | None = None) -> Iterator[tuple[str, bytes]]:
+    """
+    Render the bulletins of the weeks in parallel and yield `(week, document)` as soon as each one is ready
+    (in the order they finish, not in the order of `weeks`).
+    """
+    pool = pool or get_pool()
+    try:
+        futures = [pool.submit(_render_week, week) for week in weeks]
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OOM killer), start a new pool next time
+        _reset_pool(pool)
+        raise
+
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def merge_documents(documents: Iterable[bytes]) -> bytes:
+    """Merge PDF documents into one."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for document in documents:
+        writer.append(io.BytesIO(document))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def render_merged(weeks: list[str], pool: ProcessPoolExecutor | None = None) -> bytes:
+    """Render the bulletins of the weeks in parallel and return them merged in one PDF, in order."""
+    documents = dict(iter_rendered_weeks(weeks, pool))
+    return merge_documents(documents[week] for week in weeks)
+
+
+class _ZipStream:
+    """Unseekable file that keeps what is written until it is popped."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        ret = b"".join(self._chunks)
+        self._chunks.clear()
+        return ret
+
+
+def iter_zip(documents: Iterable[tuple[str, bytes]]) -> Iterator[bytes]:
+    """Yield the chunks of a ZIP file of the `(week, document)`s, as soon as each document is available."""
+    stream = _ZipStream()
+    # The PDFs are already compressed
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as file:
+        for week, document in documents:
+            file.writestr(f"feuille-annonces-{week}.pdf", document)
+            yield stream.pop()
+    yield stream.pop()
@@ -0,0 +1,83 @@
+import datetime as dt
+import threading
+from collections import OrderedDict
+
+from dateutil.rrule import rruleset, rrulestr
+from django.conf import settings
+from django.db import models
+
+
+class RuleCache:
+    """
+    Bounded, thread-safe LRU cache of the compiled `rruleset`s.
+
+    The keys are `(model label, pk, rule text, dtstart)`: the rule text is part of the key
+    so an unsaved edit (e.g. in the admin preview) never returns a stale rule, and the
+    `dtstart` is needed because `rrulestr` anchors the rules without a `DTSTART` on it.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._rules: OrderedDict[tuple, rruleset] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, instance: models.Model, text: str, dtstart: dt.date) -> rruleset:
+        """Return the compiled `rruleset` for the `text` rule of `instance`."""
+        if instance.pk is None:
+            # Unsaved objects can't be invalidated, don't keep them
+            with self._lock:
+                self.misses += 1
+            return rrulestr(text, dtstart=dtstart, forceset=True)
+
+        key = (instance._meta.label, instance.pk, text, dtstart)
+        with self._lock:
+            ret = self._rules.get(key)
+            if ret is not None:
+                self._rules.move_to_end(key)
+                self.hits += 1
+                return ret
+            self.misses += 1
+
+        # Parse outside of the lock, the worst case is a rule parsed twice
+        ret = rrulestr(text, dtstart=dtstart, forceset=True)
+
+        with self._lock:
+            self._rules[key] = ret
+            self._rules.move_to_end(key)
+            while len(self._rules) > self.maxsize:
+                self._rules.popitem(last=False)
+        return ret
+
+    def invalidate(self, model: type[models.Model], pk):
+        """Remove all the rules of an object from the cache."""
+        label = model._meta.label
+        with self._lock:
+            for key in [key for key in self._rules if key[0] == label and key[1] == pk]:
+                del self._rules[key]
+
+    def clear(self):
+        with self._lock:
+            self._rules.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._rules),
+                "maxsize": self.maxsize,
+            }
+
+
+rule_cache = RuleCache(getattr(settings, "RULE_CACHE_SIZE", 512))
+
+
+def invalidate_rule_cache(sender: type[models.Model], instance: models.Model, **_kwargs):
+    """
+    Removes the compiled rules of a saved or deleted object.
+    """
+    rule_cache.invalidate(sender, instance.pk)
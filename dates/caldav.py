@@ -0,0 +1,418 @@
+"""
+CalDAV access to the calendar of the `export` view (RFC 4791), with the `sync-collection` report of RFC 6578.
+
+Each recurrence (with the dates that override its occurrences) and each other date is a calendar
+object resource, named after its UID in `dates.ical`.
+
+Every save or deletion of a date or a recurrence moves its resource at the end of the change log
+(one `CalendarChange` row per resource, with a new id): the id of the last change is the ctag
+and the sync token of the collection, the id of the change of a resource is its ETag,
+and the resources that changed since a sync token are the rows with a greater id.
+"""
+
+import datetime as dt
+import re
+from itertools import chain, islice
+from typing import Iterable, Iterator
+from urllib.parse import unquote
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.timezone import get_current_timezone
+
+from .ical import (
+    CALENDAR_NAME,
+    FRAGMENTS_BATCH,
+    MAX_RANGE,
+    build_event,
+    build_series,
+    get_series_uid,
+    get_uid,
+    iter_calendar,
+    iter_export_occurrences,
+)
+from .models import CalendarChange, Date, Recurrence
+
+DAV = "DAV:"
+CALDAV = "urn:ietf:params:xml:ns:caldav"
+CALENDARSERVER = "http://calendarserver.org/ns/"
+PREFIXES = {DAV: "D", CALDAV: "C", CALENDARSERVER: "CS"}
+
+RESOURCETYPE = f"{{{DAV}}}resourcetype"
+DISPLAYNAME = f"{{{DAV}}}displayname"
+GETETAG = f"{{{DAV}}}getetag"
+GETCONTENTTYPE = f"{{{DAV}}}getcontenttype"
+SYNC_TOKEN = f"{{{DAV}}}sync-token"
+GETCTAG = f"{{{CALENDARSERVER}}}getctag"
+CALENDAR_DATA = f"{{{CALDAV}}}calendar-data"
+
+# Properties sent when the client doesn't ask for specific ones (allprop)
+COLLECTION_PROPS = [RESOURCETYPE, DISPLAYNAME, GETCTAG, SYNC_TOKEN]
+RESOURCE_PROPS = [RESOURCETYPE, GETETAG, GETCONTENTTYPE]
+
+CONTENT_TYPE = "text/calendar; charset=utf-8; component=vevent"
+SYNC_TOKEN_PREFIX = "urn:sitekt:sync:"
+RESOURCE_RE = re.compile(r"(recurrence|date)-(\d+)")
+
+# DTSTAMP of the resources that didn't change since the change log exists
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def record_change(name: str):
+    """Move a resource at the end of the change log."""
+    try:
+        with transaction.atomic():
+            CalendarChange.objects.filter(name=name).delete()
+            CalendarChange.objects.create(name=name)
+    except IntegrityError:
+        # Recorded by another process at the same time, its row is newer anyway
+        pass
+
+
+def record_changes(names: Iterable[str]):
+    """Move several resources at the end of the change log at once (for the bulk operations)."""
+    names = list(dict.fromkeys(names))
+    with transaction.atomic():
+        CalendarChange.objects.filter(name__in=names).delete()
+        CalendarChange.objects.bulk_create([CalendarChange(name=name) for name in names])
+
+
+def get_date_changes(date: Date) -> list[str]:
+    """Return the names of the resources changed by the save or deletion of a date."""
+    # The date may have just been linked to a recurrence, its own resource must then disappear
+    names = [f"date-{date.pk}"]
+    for event_id in (getattr(date, "_previous_event_id", None), date.event_id):
+        if event_id is not None:
+            names.append(f"recurrence-{event_id}")
+    return list(dict.fromkeys(names))
+
+
+def remember_previous_event(sender: type[models.Model], instance: Date, raw=False, **_kwargs):
+    """
+    Remembers the recurrence of a date before it is saved, to update its resource if the date leaves it.
+    """
+    if raw or instance.pk is None:
+        return
+    instance._previous_event_id = Date._base_manager.filter(pk=instance.pk).values_list("event_id", flat=True).first()
+
+
+def record_calendar_change(sender: type[models.Model], instance: models.Model, raw=False, **_kwargs):
+    """
+    Records the change of the resource of a saved or deleted date or recurrence.
+    """
+    if raw:
+        return
+    if isinstance(instance, Recurrence):
+        record_change(f"recurrence-{instance.pk}")
+        return
+    for name in get_date_changes(instance):
+        record_change(name)
+
+
+def get_sync_token() -> int:
+    """Return the id of the last change (0 if nothing changed)."""
+    return CalendarChange.objects.aggregate(token=models.Max("pk"))["token"] or 0
+
+
+def format_sync_token(token: int) -> str:
+    return f"{SYNC_TOKEN_PREFIX}{token}"
+
+
+def parse_sync_token(text: str) -> int:
+    """Return the id of the change of a sync token, raise ValueError if it is not one of ours."""
+    if not text.startswith(SYNC_TOKEN_PREFIX):
+        raise ValueError(f"Invalid sync token {text!r}")
+    return int(text.removeprefix(SYNC_TOKEN_PREFIX))
+
+
+def get_etag(change: CalendarChange | None) -> str:
+    return f'"{change.pk if change else 0}"'
+
+
+def get_href(name: str) -> str:
+    return reverse("calendar-object", args=[name])
+
+
+def parse_href(href: str) -> str:
+    """Return the name of the resource of an href (it may not exist)."""
+    return unquote(href.rstrip("/").rsplit("/", 1)[-1]).removesuffix(".ics")
+
+
+def iter_names() -> Iterator[str]:
+    """Yield the names of all the resources of the collection."""
+    for pk in Recurrence.objects.order_by("pk").values_list("pk", flat=True).iterator():
+        yield f"recurrence-{pk}"
+    dates = Date._base_manager.filter(event__isnull=True, ignored=False).order_by("pk")
+    for pk in dates.values_list("pk", flat=True).iterator():
+        yield f"date-{pk}"
+
+
+def iter_names_between(start: dt.date, end: dt.date) -> Iterator[str]:
+    """Yield the names of the resources that have an occurrence between `start` and `end` (included)."""
+    seen = set()
+    for occurrence in iter_export_occurrences(start, end):
+        name = get_series_uid(occurrence.event) if occurrence.event_id is not None else get_uid(occurrence)
+        if name not in seen:
+            seen.add(name)
+            yield name
+
+
+def iter_changed_names(since: int, until: int) -> Iterator[str]:
+    """Yield the names of the resources changed after the `since` sync token, up to the `until` one."""
+    changes = CalendarChange.objects.filter(pk__gt=since, pk__lte=until).order_by("pk")
+    return changes.values_list("name", flat=True).iterator()
+
+
+def split_names(names: Iterable[str]) -> dict[str, list[int]]:
+    """Return the primary keys of the recurrences and of the dates of a list of names (the invalid ones are skipped)."""
+    ret = {"recurrence": [], "date": []}
+    for name in names:
+        if match := RESOURCE_RE.fullmatch(name):
+            ret[match[1]].append(int(match[2]))
+    return ret
+
+
+def get_existing(names: list[str]) -> set[str]:
+    """Return the names of the resources that exist."""
+    pks = split_names(names)
+    recurrences = Recurrence.objects.filter(pk__in=pks["recurrence"]).values_list("pk", flat=True)
+    dates = Date._base_manager.filter(pk__in=pks["date"], event__isnull=True, ignored=False).values_list("pk", flat=True)
+    return {*(f"recurrence-{pk}" for pk in recurrences), *(f"date-{pk}" for pk in dates)}
+
+
+def build_resources(names: list[str], changes: dict[str, CalendarChange]) -> dict[str, bytes]:
+    """Return the serialized VEVENTs of each resource (empty if it doesn't exist), with 3 queries."""
+    pks = split_names(names)
+    recurrences = Recurrence.objects.in_bulk(pks["recurrence"])
+    overrides: dict[int, list[Date]] = {}
+    stored = Date._base_manager.filter(event__in=pks["recurrence"]).select_related("event").order_by("start_date", "pk")
+    for date in stored.iterator():
+        overrides.setdefault(date.event_id, []).append(date)
+    dates = Date._base_manager.filter(event__isnull=True, ignored=False).in_bulk(pks["date"])
+
+    ret = {}
+    for name in names:
+        # The DTSTAMP must only change with the resource, otherwise its ETag would be wrong
+        stamp = changes[name].changed_at if name in changes else EPOCH
+        events = []
+        if match := RESOURCE_RE.fullmatch(name):
+            pk = int(match[2])
+            if match[1] == "recurrence" and pk in recurrences:
+                events = build_series(recurrences[pk], overrides.get(pk, ()), stamp)
+            elif match[1] == "date" and pk in dates:
+                events = [build_event(dates[pk], stamp)]
+        ret[name] = b"".join(event.to_ical() for event in events)
+    return ret
+
+
+def iter_resources(names: Iterable[str], data=False) -> Iterator[tuple[str, CalendarChange | None, bytes | None]]:
+    """
+    Yield `(name, last change, serialized VEVENTs)` for each resource, by batches.
+
+    The VEVENTs are only given if `data` is True, cached under the id of the last change
+    of the resource; they are None if the resource doesn't exist.
+    """
+    names = iter(names)
+    while batch := list(islice(names, FRAGMENTS_BATCH)):
+        changes = CalendarChange.objects.in_bulk(batch, field_name="name")
+        if not data:
+            existing = get_existing(batch)
+            for name in batch:
+                yield name, changes.get(name), b"" if name in existing else None
+            continue
+
+        keys = {name: f"caldav:{name}:{changes[name].pk if name in changes else 0}" for name in batch}
+        fragments = cache.get_many(keys.values())
+        missing = [name for name in batch if keys[name] not in fragments]
+        if missing:
+            built = {keys[name]: fragment for name, fragment in build_resources(missing, changes).items()}
+            cache.set_many(built, getattr(settings, "ICAL_CACHE_TIMEOUT", 7 * 24 * 3600))
+            fragments.update(built)
+        for name in batch:
+            yield name, changes.get(name), fragments[keys[name]] or None
+
+
+def get_calendar_data(fragment: bytes) -> bytes:
+    """Return the calendar of one resource."""
+    return b"".join(iter_calendar([fragment]))
+
+
+def render_prop(tag: str, value: str = "") -> str:
+    """Return the XML of a property (`tag` is in Clark notation, `value` is already escaped)."""
+    namespace, local = tag[1:].split("}", 1)
+    if namespace in PREFIXES:
+        name, xmlns = f"{PREFIXES[namespace]}:{local}", ""
+    else:
+        name, xmlns = f"X:{local}", f' xmlns:X="{escape(namespace)}"'
+    return f"<{name}{xmlns}>{value}</{name}>" if value else f"<{name}{xmlns}/>"
+
+
+def render_response(href: str, values: dict[str, str], requested: list[str]) -> str:
+    """Return the `response` element of a resource, with the `requested` properties found in `values`."""
+    ret = f"<D:response><D:href>{escape(href)}</D:href>"
+    found = "".join(render_prop(tag, values[tag]) for tag in requested if tag in values)
+    if found:
+        ret += f"<D:propstat><D:prop>{found}</D:prop><D:status>HTTP/1.1 200 OK</D:status></D:propstat>"
+    not_found = "".join(render_prop(tag) for tag in requested if tag not in values)
+    if not_found:
+        ret += f"<D:propstat><D:prop>{not_found}</D:prop><D:status>HTTP/1.1 404 Not Found</D:status></D:propstat>"
+    return ret + "</D:response>\n"
+
+
+def render_status(href: str, status: str) -> str:
+    return f"<D:response><D:href>{escape(href)}</D:href><D:status>HTTP/1.1 {status}</D:status></D:response>\n"
+
+
+def get_collection_props(href: str, token: int) -> dict[str, str]:
+    reports = ("<C:calendar-query/>", "<C:calendar-multiget/>", "<D:sync-collection/>")
+    return {
+        RESOURCETYPE: "<D:collection/><C:calendar/>",
+        DISPLAYNAME: escape(CALENDAR_NAME),
+        GETCTAG: str(token),
+        SYNC_TOKEN: escape(format_sync_token(token)),
+        f"{{{CALDAV}}}supported-calendar-component-set": '<C:comp name="VEVENT"/>',
+        f"{{{DAV}}}supported-report-set": "".join(
+            f"<D:supported-report><D:report>{report}</D:report></D:supported-report>" for report in reports
+        ),
+        # There are no accounts: the collection is its own principal and home
+        f"{{{DAV}}}current-user-principal": f"<D:href>{escape(href)}</D:href>",
+        f"{{{CALDAV}}}calendar-home-set": f"<D:href>{escape(href)}</D:href>",
+    }
+
+
+def iter_resource_responses(names: Iterable[str], requested: list[str]) -> Iterator[str]:
+    """Yield the `response` elements of resources (404 for the ones that don't exist)."""
+    data = CALENDAR_DATA in requested
+    for name, change, fragment in iter_resources(names, data):
+        href = get_href(name)
+        if fragment is None:
+            yield render_status(href, "404 Not Found")
+            continue
+        values = {RESOURCETYPE: "", GETETAG: escape(get_etag(change)), GETCONTENTTYPE: CONTENT_TYPE}
+        if data:
+            values[CALENDAR_DATA] = escape(get_calendar_data(fragment).decode())
+        yield render_response(href, values, requested)
+
+
+def multistatus(responses: Iterable[str], sync_token: int | None = None) -> StreamingHttpResponse:
+    """Return a 207 response that streams the `response` elements."""
+    def iter_body():
+        namespaces = " ".join(f'xmlns:{prefix}="{namespace}"' for namespace, prefix in PREFIXES.items())
+        yield f'<?xml version="1.0" encoding="utf-8"?>\n<D:multistatus {namespaces}>\n'
+        yield from responses
+        if sync_token is not None:
+            yield f"<D:sync-token>{escape(format_sync_token(sync_token))}</D:sync-token>\n"
+        yield "</D:multistatus>\n"
+
+    return StreamingHttpResponse(iter_body(), status=207, content_type="application/xml; charset=utf-8")
+
+
+def precondition_failed(condition: str) -> HttpResponse:
+    """Return a 403 response for a failed DAV precondition."""
+    return HttpResponse(
+        f'<?xml version="1.0" encoding="utf-8"?>\n<D:error xmlns:D="DAV:"><D:{condition}/></D:error>\n',
+        status=403,
+        content_type="application/xml; charset=utf-8",
+    )
+
+
+def parse_body(request) -> ElementTree.Element | None:
+    """Return the root of the XML body of a request (None if it is empty), raise ValueError if it is invalid."""
+    if not request.body.strip():
+        return None
+    try:
+        return ElementTree.fromstring(request.body)
+    except ElementTree.ParseError as err:
+        raise ValueError(f"Invalid XML: {err}") from err
+
+
+def get_requested_props(root: ElementTree.Element | None) -> list[str] | None:
+    """Return the properties asked in a PROPFIND or REPORT body (None for all the properties)."""
+    prop = root.find(f"{{{DAV}}}prop") if root is not None else None
+    if prop is None:
+        return None
+    return [child.tag for child in prop]
+
+
+def parse_time_range(element: ElementTree.Element) -> tuple[dt.date, dt.date]:
+    """Return the days of a CalDAV `time-range` (its end is excluded), raise ValueError if it is invalid."""
+    def parse(value: str) -> dt.datetime:
+        return dt.datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=dt.timezone.utc)
+
+    timezone = get_current_timezone()
+    start = parse(element.get("start")).astimezone(timezone).date() if element.get("start") else None
+    end = (parse(element.get("end")) - dt.timedelta(microseconds=1)).astimezone(timezone).date() if element.get("end") else None
+    if start is None and end is None:
+        raise ValueError("Empty time range")
+    start = start or end - MAX_RANGE
+    end = end or start + MAX_RANGE
+    if not start <= end <= start + MAX_RANGE:
+        raise ValueError(f"The end must be after the start and at most {MAX_RANGE.days} days after it")
+    return start, end
+
+
+def options() -> HttpResponse:
+    response = HttpResponse()
+    response["DAV"] = "1, 3, calendar-access"
+    response["Allow"] = "OPTIONS, GET, PROPFIND, REPORT"
+    return response
+
+
+def propfind(request) -> HttpResponse:
+    """Answer a PROPFIND on the collection (with its resources unless `Depth: 0`)."""
+    try:
+        requested = get_requested_props(parse_body(request))
+    except ValueError as err:
+        return HttpResponseBadRequest(str(err))
+
+    href = reverse("export")
+    responses = iter([render_response(href, get_collection_props(href, get_sync_token()), requested or COLLECTION_PROPS)])
+    if request.headers.get("Depth", "1") != "0":
+        responses = chain(responses, iter_resource_responses(iter_names(), requested or RESOURCE_PROPS))
+    return multistatus(responses)
+
+
+def report(request) -> HttpResponse:
+    """Answer a `calendar-query`, `calendar-multiget` or `sync-collection` REPORT on the collection."""
+    try:
+        root = parse_body(request)
+    except ValueError as err:
+        return HttpResponseBadRequest(str(err))
+    if root is None:
+        return HttpResponseBadRequest("Missing report")
+    requested = get_requested_props(root) or RESOURCE_PROPS
+
+    if root.tag == f"{{{CALDAV}}}calendar-query":
+        time_range = root.find(f".//{{{CALDAV}}}time-range")
+        if time_range is None:
+            return multistatus(iter_resource_responses(iter_names(), requested))
+        try:
+            start, end = parse_time_range(time_range)
+        except ValueError as err:
+            return HttpResponseBadRequest(str(err))
+        return multistatus(iter_resource_responses(iter_names_between(start, end), requested))
+
+    if root.tag == f"{{{CALDAV}}}calendar-multiget":
+        names = [parse_href(href.text or "") for href in root.iter(f"{{{DAV}}}href")]
+        return multistatus(iter_resource_responses(names, requested))
+
+    if root.tag == f"{{{DAV}}}sync-collection":
+        # Read the token first, the changes made while answering will be sent on the next sync
+        token = get_sync_token()
+        text = (root.findtext(f"{{{DAV}}}sync-token") or "").strip()
+        if not text:
+            return multistatus(iter_resource_responses(iter_names(), requested), sync_token=token)
+        try:
+            since = parse_sync_token(text)
+        except ValueError:
+            return precondition_failed("valid-sync-token")
+        if since > token:
+            return precondition_failed("valid-sync-token")
+        return multistatus(iter_resource_responses(iter_changed_names(since, token), requested), sync_token=token)
+
+    return precondition_failed("supported-report")
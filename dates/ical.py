@@ -0,0 +1,288 @@
+"""
+iCalendar export of the occurrences.
+
+Each VEVENT is serialized once as a fragment, cached under the data version
+(see `dates.versions`): a feed is then assembled by concatenating the cached fragments
+between the header of the calendar and its timezone, without building the `Calendar` tree.
+
+By default, each `Recurrence` is exported as one VEVENT carrying its rule (the dates that override
+one of its occurrences become RECURRENCE-ID instances or EXDATEs); `iter_export_occurrences`
+gives the expanded occurrences instead, for the clients that don't understand the rules
+and for the filtered feeds: their fragments are cached by UID, so all the feeds share them.
+"""
+
+import datetime as dt
+import re
+from functools import lru_cache, partial
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from dateutil.rrule import rrule, rruleset
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import get_current_timezone
+from icalendar import Alarm, Calendar, Event, Timezone, vRecur
+
+from .cache import rule_cache
+from .models import Date, Recurrence
+from .occurrences import iter_occurrences
+from .utils import MASS_RE, serialize_rruleset
+
+CALENDAR_NAME = "Calendrier caté"
+
+# Number of fragments fetched from the cache at once
+FRAGMENTS_BATCH = 200
+
+# Longest range that can be exported at once
+MAX_RANGE = dt.timedelta(days=5 * 366)
+
+# Longest regex accepted to filter the titles
+MAX_TITLE_PATTERN = 200
+
+
+def iter_export_occurrences(
+    start: dt.date,
+    end: dt.date,
+    celebrant: int | None = None,
+    title: re.Pattern | None = None,
+    cancelled=True,
+    masses=False,
+) -> Iterator[Date]:
+    """
+    Lazily yield the dates and the occurrences of the recurrences between `start` and `end` (included).
+
+    They can be restricted to a `celebrant` (only the stored dates have one), to the titles
+    where the `title` regex is found, to the masses and celebrations (with `masses=True`, see `MASS_RE`)
+    and to the dates that are not cancelled (with `cancelled=False`).
+    The ignored dates are only used to hide the occurrences they override.
+    """
+    queryset = Date._base_manager.all()
+    if celebrant is not None:
+        queryset = queryset.filter(celebrant_id=celebrant)
+    occurrences = iter_occurrences(start, end, True, queryset=queryset, recurrences=celebrant is None, feasts=False)
+    for occurrence in occurrences:
+        if occurrence.ignored or (occurrence.cancelled and not cancelled):
+            continue
+        if title is not None and not title.search(occurrence.title):
+            continue
+        if masses and not MASS_RE.match(occurrence.title):
+            continue
+        yield occurrence
+
+
+def get_uid(occurrence: Date) -> str:
+    """
+    Return the UID of an occurrence.
+
+    A date that overrides an occurrence of a recurrence has the same UID as the occurrence,
+    so that the calendars update the event instead of adding a new one.
+    The start time tells apart the occurrences of the same day.
+    """
+    if occurrence.event_id is not None:
+        uid = f"{occurrence.event.pk}_{occurrence.start_date:%Y%m%d}"
+        if occurrence.start_time:
+            uid += f"T{occurrence.start_time:%H%M%S}"
+        return uid
+    return f"date-{occurrence.pk}"
+
+
+def build_event(occurrence: Date, stamp: dt.datetime, uid: str | None = None) -> Event:
+    """Return the VEVENT of an occurrence, with its reminders."""
+    event = Event()
+    event.add("summary", occurrence.title)
+    event.add("DTSTAMP", stamp)
+    event.uid = uid or get_uid(occurrence)
+    event.start = occurrence.start
+    if occurrence.cancelled:
+        event.add("status", "CANCELLED")
+
+    # Without an end time, the end is only a date, but the DTSTART and the DTEND must have the same type:
+    # the event then ends at its start (RFC 5545), and is imported back without an end time
+    if not isinstance(occurrence.start, dt.datetime) or occurrence.end_time is not None:
+        event.end = occurrence.end
+
+    # Add reminders
+    # Reminder 1: 1 day before at 5 PM
+    alarm1 = Alarm()
+    alarm1.add("action", "DISPLAY")
+    alarm1.add("description", f'"{occurrence.title}" commence demain' + (f" à {occurrence.start.time()}" if isinstance(occurrence.start, dt.datetime) else ""))
+    # 1 day before at 5 PM (relative to the start, so that it also works on the occurrences of a series)
+    start_time = occurrence.start_time or dt.time.min
+    alarm1.add("trigger", -dt.timedelta(hours=start_time.hour + 7, minutes=start_time.minute))
+    event.add_component(alarm1)
+
+    # Reminder 2: 15 minutes before (only if not an all-day event)
+    if isinstance(occurrence.start, dt.datetime):
+        alarm2 = Alarm()
+        alarm2.add("action", "DISPLAY")
+        alarm2.add("description", f'"{occurrence.title}" commence dans 15 minutes')
+        # 15 minutes before
+        alarm2.add("trigger", -dt.timedelta(minutes=15))
+        event.add_component(alarm2)
+
+    return event
+
+
+def get_series_uid(recurrence: Recurrence) -> str:
+    """Return the UID of the VEVENT of a recurrence (shared by the dates that override its occurrences)."""
+    return f"recurrence-{recurrence.pk}"
+
+
+def build_series(recurrence: Recurrence, overrides: Iterable[Date], stamp: dt.datetime) -> list[Event]:
+    """
+    Return the VEVENT of a recurrence, with its RRULEs, EXRULEs, RDATEs and EXDATEs,
+    followed by the VEVENTs of the stored `overrides` (dates linked to the recurrence).
+
+    An ignored date becomes an EXDATE and the other ones become RECURRENCE-ID instances,
+    unless they are not on an occurrence of the recurrence (they are then separate events).
+    The rules without DTSTART are anchored on the stored anchor of the recurrence, like its occurrences.
+    """
+    rules = rule_cache.get(recurrence, recurrence.recurrence, recurrence.anchor)
+    first = next(iter(rules), None)
+    if first is None:
+        return []
+
+    # The rules with BYHOUR or BYMINUTE give the times of the occurrences (see `HasOccurrences._get_occurrences`),
+    # the other ones give days at midnight, which are at the time of the recurrence
+    rule_times = any(
+        rule._original_rule.get("byhour") or rule._original_rule.get("byminute")
+        for rule in rules._rrule
+    )
+
+    def get_start(occurrence: dt.datetime) -> dt.date:
+        if rule_times:
+            return dt.datetime.combine(occurrence.date(), occurrence.time(), get_current_timezone())
+        return Date(event=recurrence, start_date=occurrence.date()).start
+
+    def move(rule: rrule) -> rrule:
+        if rule_times:
+            return rule.replace(dtstart=first)
+        # Put the days at the time of the recurrence
+        kwargs = {"dtstart": dt.datetime.combine(first.date(), recurrence.start_time or dt.time.min)}
+        if rule._until:
+            kwargs["until"] = dt.datetime.combine(rule._until.date(), recurrence.start_time or dt.time.min)
+        return rule.replace(**kwargs)
+
+    moved = rruleset()
+    for rule in rules._rrule:
+        moved.rrule(move(rule))
+    for rule in rules._exrule:
+        moved.exrule(move(rule))
+
+    uid = get_series_uid(recurrence)
+    # The DTSTART must be a DATE-TIME when the rule has times
+    series = build_event(
+        Date(event=recurrence, start_date=first.date(), _start_time=first.time() if rule_times else None),
+        stamp,
+        uid=uid,
+    )
+    all_day = recurrence.start_time is None and not rule_times
+    for line in serialize_rruleset(moved).splitlines():
+        name, value = line.split(":", 1)
+        recur = vRecur.from_ical(value)
+        if all_day and "UNTIL" in recur:
+            # The UNTIL of an all-day event must be a date, like its DTSTART
+            recur["UNTIL"] = [until.astimezone(get_current_timezone()).date() for until in recur["UNTIL"]]
+        series.add(name, recur)
+    for date in rules._rdate:
+        series.add("rdate", get_start(date))
+    for date in rules._exdate:
+        series.add("exdate", get_start(date))
+
+    events = [series]
+    for override in overrides:
+        day = override.start_date
+        instances = [
+            get_start(occurrence)
+            for occurrence in rules.between(dt.datetime.combine(day, dt.time.min), dt.datetime.combine(day, dt.time.max), inc=True)
+        ]
+        if not instances:
+            if not override.ignored:
+                events.append(build_event(override, stamp))
+            continue
+        # A stored date replaces all the occurrences of its day (see `iter_occurrences`):
+        # the one at the same time (or the first one) is overridden, the other ones are removed
+        replaced = None
+        if not override.ignored:
+            replaced = override.start if override.start in instances else instances[0]
+            event = build_event(override, stamp, uid=uid)
+            event.add("recurrence-id", replaced)
+            events.append(event)
+        for instance in instances:
+            if instance != replaced:
+                series.add("exdate", instance)
+    return events
+
+
+def iter_cached(items: Iterable[tuple[str, Callable[[], bytes]]]) -> Iterator[bytes]:
+    """
+    Yield the fragments of `(cache key, builder)` pairs.
+
+    The fragments are fetched from the cache by batches, only the missing ones are built.
+    """
+    items = iter(items)
+    while batch := list(islice(items, FRAGMENTS_BATCH)):
+        fragments = cache.get_many([key for key, _build in batch])
+        missing = {}
+        for key, build in batch:
+            if key not in fragments:
+                fragments[key] = missing[key] = build()
+        if missing:
+            cache.set_many(missing, getattr(settings, "ICAL_CACHE_TIMEOUT", 7 * 24 * 3600))
+        for key, _build in batch:
+            yield fragments[key]
+
+
+def iter_fragments(occurrences: Iterable[Date], version: str, stamp: dt.datetime) -> Iterator[bytes]:
+    """Yield the serialized VEVENT of each occurrence."""
+    def build(occurrence: Date) -> bytes:
+        return build_event(occurrence, stamp).to_ical()
+
+    return iter_cached((f"vevent:{version}:{get_uid(occurrence)}", partial(build, occurrence)) for occurrence in occurrences)
+
+
+def iter_series_fragments(start: dt.date, end: dt.date, version: str, stamp: dt.datetime) -> Iterator[bytes]:
+    """
+    Yield the serialized VEVENTs of the recurrences (with their overrides between `start` and `end`)
+    and of the other dates between `start` and `end`.
+    """
+    overrides: dict[int, list[Date]] = {}
+    stored = Date._base_manager.filter(start_date__range=(start, end)).select_related("event").order_by("start_date", "pk")
+    for date in stored.filter(event__isnull=False).iterator():
+        overrides.setdefault(date.event_id, []).append(date)
+
+    def build(recurrence: Recurrence) -> bytes:
+        return b"".join(event.to_ical() for event in build_series(recurrence, overrides.get(recurrence.pk, ()), stamp))
+
+    # The overrides of a series depend on the range
+    yield from iter_cached(
+        (f"vevent:{version}:{get_series_uid(recurrence)}:{start}:{end}", partial(build, recurrence))
+        for recurrence in Recurrence.objects.order_by("pk").iterator()
+    )
+    yield from iter_fragments(stored.filter(event__isnull=True, ignored=False).iterator(), version, stamp)
+
+
+def get_calendar_header() -> bytes:
+    """Return the beginning of the calendar (everything before its components)."""
+    cal = Calendar()
+    cal.calendar_name = CALENDAR_NAME
+    cal.description = cal.calendar_name
+    cal.add("PRODID", f"-//Secteur paroissial de l'Embrunais et du Savinois//Espace caté {dt.date.today().year} (https://github.com/lfavole/sitekt)//")  # FIXME
+    cal.add("VERSION", "2.0")
+    cal.add("X-WR-CALNAME", cal.calendar_name)
+    cal.add("X-WR-CALDESC", cal.calendar_name)
+    return cal.to_ical().removesuffix(b"END:VCALENDAR\r\n")
+
+
+@lru_cache(maxsize=8)
+def get_timezone(tzid: str) -> bytes:
+    """Return the serialized VTIMEZONE of a timezone (the one used by the occurrences)."""
+    return Timezone.from_tzid(tzid).to_ical()
+
+
+def iter_calendar(fragments: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield the chunks of a calendar of the VEVENT fragments (see `iter_fragments` and `iter_series_fragments`)."""
+    yield get_calendar_header()
+    yield get_timezone(str(get_current_timezone()))
+    yield from fragments
+    yield b"END:VCALENDAR\r\n"
@@ -0,0 +1,302 @@
+"""
+Import of .ics files (see the `import_ics` command).
+
+`icalendar` can only parse whole texts, so the files are read line by line and split into
+their components: only one event is parsed at a time. The events with a RRULE become `Recurrence`s,
+the ones with a RECURRENCE-ID become dates that override an occurrence of their recurrence
+and the other ones become `Date`s.
+
+They are inserted by batches, each one in a transaction, without the events that already exist
+(same UID, or same title and start). The batches are inserted with `bulk_create`, which doesn't
+send the signals: the occurrences, the change log and the data versions are updated here.
+"""
+
+import datetime as dt
+from collections import Counter
+from typing import Iterable, Iterator
+
+from dateutil.rrule import rrulestr
+from django.db import transaction
+from django.utils.timezone import get_current_timezone
+from icalendar import Component, Event, vRecur
+from icalendar.timezone import tzp
+
+from .caldav import get_date_changes, record_changes
+from .models import Date, Recurrence
+from .occurrences import materialize
+from .versions import bump_version
+
+TITLE_LENGTH = Recurrence._meta.get_field("title").max_length
+UID_LENGTH = Date._meta.get_field("uid").max_length
+
+
+def iter_components(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the text of each component (VEVENT, VTIMEZONE...) of the calendars in the lines of an .ics file."""
+    component: list[str] = []
+    depth = 0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        # The folded lines start with a space, they can't be mistaken for a BEGIN or an END
+        name = line[:6].upper()
+        if name == "BEGIN:":
+            depth += 1
+        if depth >= 2:
+            component.append(line)
+        if name[:4] == "END:":
+            depth -= 1
+            if depth == 1 and component:
+                yield "\r\n".join(component) + "\r\n"
+                component = []
+
+
+def iter_events(lines: Iterable[str]) -> Iterator[Event | None]:
+    """Yield the VEVENTs in the lines of an .ics file (None for the invalid components)."""
+    for text in iter_components(lines):
+        try:
+            component = Component.from_ical(text)
+        except ValueError:
+            yield None
+            continue
+        if component.name == "VTIMEZONE":
+            # Needed to read the TZIDs of the following events
+            tzp.cache_timezone_component(component)
+        elif component.name == "VEVENT":
+            yield component
+
+
+def split_datetime(value: dt.date) -> tuple[dt.date, dt.time | None]:
+    """Return the local day and time of a DATE or DATE-TIME value (no time for a DATE)."""
+    if not isinstance(value, dt.datetime):
+        return value, None
+    if value.tzinfo is not None:
+        value = value.astimezone(get_current_timezone())
+    return value.date(), value.time()
+
+
+def get_date_fields(event: Event) -> dict:
+    """Return the start and end fields of a `Date` for an event."""
+    start = event.decoded("DTSTART")
+    start_date, start_time = split_datetime(start)
+    end_date, end_time = start_date, None
+    end = event.decoded("DTEND") if "DTEND" in event else start + event.decoded("DURATION") if "DURATION" in event else None
+    if end is not None:
+        end_date, end_time = split_datetime(end)
+        if end_time is None:
+            # The end of an all-day event is excluded
+            end_date -= dt.timedelta(days=1)
+    return {
+        "start_date": start_date,
+        "_start_time": start_time,
+        "_end_date": end_date if end_date > start_date else None,
+        "_end_time": end_time,
+    }
+
+
+def get_rule(event: Event, start_date: dt.date, start_time: dt.time | None = None) -> str:
+    """
+    Return the rule of a recurring event, in the format of `Recurrence.recurrence`.
+
+    Like the rules of the app, it gives the days of the occurrences at midnight (the times are
+    stored on the recurrence), in local time, unless it has BYHOUR or BYMINUTE: it then gives
+    the times of the occurrences, which are kept.
+    """
+    def as_list(value):
+        return value if isinstance(value, list) else [value]
+
+    rules = [vRecur(rule) for rule in as_list(event["RRULE"])]
+    rule_times = any("BYHOUR" in rule or "BYMINUTE" in rule for rule in rules)
+
+    def format_datetime(value: dt.date) -> str:
+        day, time = split_datetime(value)
+        return f"{day:%Y%m%d}T{time if rule_times and time else dt.time.min:%H%M%S}"
+
+    lines = [f"DTSTART:{start_date:%Y%m%d}T{start_time if rule_times and start_time else dt.time.min:%H%M%S}"]
+    for rule in rules:
+        if "UNTIL" in rule:
+            rule["UNTIL"] = [
+                dt.datetime.combine(day, time if rule_times and time else dt.time(23, 59, 59))
+                for day, time in map(split_datetime, rule["UNTIL"])
+            ]
+        lines.append(f"RRULE:{rule.to_ical().decode()}")
+    for name in ("RDATE", "EXDATE"):
+        values = [value.dt for values in as_list(event.get(name, [])) for value in values.dts]
+        if values:
+            lines.append(f"{name}:" + ",".join(map(format_datetime, values)))
+    return "\n".join(lines)
+
+
+def parse_event(event: Event) -> list[tuple[str, Date | Recurrence]]:
+    """
+    Return the objects of an event: `("recurrence", Recurrence)`, `("date", Date)`
+    or `("override", Date)` (with the UID of its recurrence). Raise ValueError if it can't be imported.
+    """
+    if "DTSTART" not in event:
+        raise ValueError("Missing DTSTART")
+    uid = str(event.get("UID", ""))[:UID_LENGTH]
+    title = str(event.get("SUMMARY", "")).strip()[:TITLE_LENGTH]
+    if not title and "RECURRENCE-ID" not in event:
+        raise ValueError("Missing SUMMARY")
+    fields = get_date_fields(event)
+
+    if "RRULE" in event:
+        rule = get_rule(event, fields["start_date"], fields["_start_time"])
+        rrulestr(rule, forceset=True)  # raises ValueError if the rule is invalid
+        recurrence = Recurrence(
+            uid=uid,
+            title=title,
+            start_time=fields["_start_time"],
+            end_time=fields["_end_time"],
+            recurrence=rule,
+        )
+        return [("recurrence", recurrence)]
+
+    date = Date(
+        uid=uid,
+        _title=title,
+        note=str(event.get("DESCRIPTION", "")),
+        cancelled=str(event.get("STATUS", "")).upper() == "CANCELLED",
+        **fields,
+    )
+    if "RECURRENCE-ID" not in event:
+        return [("date", date)]
+
+    day, _time = split_datetime(event.decoded("RECURRENCE-ID"))
+    if day == date.start_date:
+        return [("override", date)]
+    # Moved to another day: hide the occurrence and add a separate date
+    date.uid = ""
+    return [("override", Date(uid=uid, start_date=day, ignored=True)), ("date", date)]
+
+
+class Importer:
+    """
+    Insert the objects of the parsed events by batches of `batch_size`, without the duplicates.
+
+    `stats` counts the `events`, the `created` objects, the `duplicates` and the `invalid` events.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.stats = Counter()
+        # Overrides whose recurrence is not imported yet
+        self.pending: list[Date] = []
+
+    def import_events(self, events: Iterable[Event | None]):
+        batch = []
+        for event in events:
+            self.stats["events"] += 1
+            try:
+                if event is None:
+                    raise ValueError("Invalid component")
+                batch.extend(parse_event(event))
+            except (KeyError, TypeError, ValueError):
+                self.stats["invalid"] += 1
+                continue
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+
+    def finish(self):
+        """Import the overrides whose recurrence was never found as separate dates."""
+        orphans = [date for date in self.pending if not date.ignored]
+        self.stats["orphans"] += len(orphans)
+        self.pending = []
+        for date in orphans:
+            # Several occurrences of the same event, they are deduplicated by title and start
+            date.uid = ""
+        for i in range(0, len(orphans), self.batch_size):
+            self.import_batch([("date", date) for date in orphans[i:i + self.batch_size]])
+
+    def import_batch(self, objects: list[tuple[str, Date | Recurrence]]):
+        with transaction.atomic():
+            recurrences = Recurrence.objects.bulk_create(self.get_new_recurrences(
+                [obj for kind, obj in objects if kind == "recurrence"]
+            ))
+            for recurrence in recurrences:
+                materialize(recurrence)
+
+            overrides = self.link_overrides(self.pending + [obj for kind, obj in objects if kind == "override"])
+            dates = Date.objects.bulk_create(
+                self.get_new_dates([obj for kind, obj in objects if kind == "date"])
+                + self.get_new_overrides(overrides)
+            )
+
+            record_changes([
+                *(f"recurrence-{recurrence.pk}" for recurrence in recurrences),
+                *(name for date in dates for name in get_date_changes(date)),
+            ])
+            bump_version(Recurrence._meta.label)
+            bump_version(Date._meta.label)
+        self.stats["created"] += len(recurrences) + len(dates)
+
+    def get_new_recurrences(self, recurrences: list[Recurrence]) -> list[Recurrence]:
+        existing_uids = set(
+            Recurrence.objects.filter(uid__in={recurrence.uid for recurrence in recurrences if recurrence.uid})
+            .values_list("uid", flat=True)
+        )
+        existing = set(
+            Recurrence.objects.filter(title__in={recurrence.title for recurrence in recurrences})
+            .values_list("title", "start_time", "recurrence")
+        )
+        ret = []
+        for recurrence in recurrences:
+            key = (recurrence.title, recurrence.start_time, recurrence.recurrence)
+            if (recurrence.uid and recurrence.uid in existing_uids) or key in existing:
+                self.stats["duplicates"] += 1
+                continue
+            existing_uids.add(recurrence.uid)
+            existing.add(key)
+            ret.append(recurrence)
+        return ret
+
+    def get_new_dates(self, dates: list[Date]) -> list[Date]:
+        stored = Date._base_manager.filter(event__isnull=True)
+        existing_uids = set(stored.filter(uid__in={date.uid for date in dates if date.uid}).values_list("uid", flat=True))
+        existing = set(
+            stored.filter(start_date__in={date.start_date for date in dates}, _title__in={date._title for date in dates})
+            .values_list("_title", "start_date", "_start_time")
+        )
+        ret = []
+        for date in dates:
+            key = (date._title, date.start_date, date._start_time)
+            if (date.uid and date.uid in existing_uids) or key in existing:
+                self.stats["duplicates"] += 1
+                continue
+            existing_uids.add(date.uid)
+            existing.add(key)
+            ret.append(date)
+        return ret
+
+    def link_overrides(self, overrides: list[Date]) -> list[Date]:
+        """Set the recurrence of the overrides (by UID), the other ones are kept for the next batches."""
+        recurrences = dict(
+            Recurrence.objects.filter(uid__in={date.uid for date in overrides if date.uid}).values_list("uid", "pk")
+        )
+        linked = []
+        self.pending = []
+        for date in overrides:
+            if date.uid in recurrences:
+                date.event_id = recurrences[date.uid]
+                linked.append(date)
+            else:
+                self.pending.append(date)
+        return linked
+
+    def get_new_overrides(self, overrides: list[Date]) -> list[Date]:
+        existing = set(
+            Date._base_manager.filter(
+                event__in={date.event_id for date in overrides},
+                start_date__in={date.start_date for date in overrides},
+            ).values_list("event_id", "start_date")
+        )
+        ret = []
+        for date in overrides:
+            key = (date.event_id, date.start_date)
+            if key in existing:
+                self.stats["duplicates"] += 1
+                continue
+            existing.add(key)
+            ret.append(date)
+        return ret
@@ -0,0 +1,83 @@
+"""
+Queue of the PDF renders done in the background.
+
+A POST on a PDF view adds a `PdfJob` row instead of rendering the document in the web worker.
+The `run_pdf_jobs` command takes the pending jobs one by one, renders them and saves the file
+in MEDIA_ROOT/jobs; the client polls the status of the job until the file is ready.
+The database is the only thing shared between the web workers and the job workers.
+"""
+
+import datetime as dt
+
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from .models import PdfJob
+
+# Documents that can be rendered in the background
+DOCUMENTS = {
+    "bulletin": "dates.pdfs.bulletin.BulletinPDF",
+    "feuille-annonces": "dates.pdfs.feuille_annonces.FeuilleAnnonces",
+    "sheet": "chants.pdfs.SheetPDF",
+}
+
+
+def enqueue(document: str, arguments: dict) -> PdfJob:
+    """Add a render of a document (with the arguments of its view) to the queue."""
+    if document not in DOCUMENTS:
+        raise ValueError(f"Unknown document {document!r}")
+    return PdfJob.objects.create(document=document, arguments=arguments)
+
+
+def claim_next(timeout: dt.timedelta) -> PdfJob | None:
+    """
+    Mark the oldest pending job as running and return it (None if there is nothing to do).
+
+    The jobs that have been running for more than `timeout` are considered lost (worker killed)
+    and are taken again.
+    """
+    claimable = Q(status=PdfJob.Status.PENDING) | Q(status=PdfJob.Status.RUNNING, started_at__lt=now() - timeout)
+    while True:
+        job = PdfJob.objects.filter(claimable).order_by("created_at").first()
+        if job is None:
+            return None
+        # Only one worker can win the update, the others try the next job
+        claimed = PdfJob.objects.filter(claimable, pk=job.pk).update(status=PdfJob.Status.RUNNING, started_at=now())
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run(job: PdfJob):
+    """Render the document of a claimed job and save it."""
+    try:
+        document = import_string(DOCUMENTS[job.document])
+        data = document.get_document(**job.arguments)
+    except Exception as err:
+        job.status = PdfJob.Status.FAILED
+        job.error = f"{type(err).__name__}: {err}"
+        job.finished_at = now()
+        job.save(update_fields=["status", "error", "finished_at"])
+        raise
+
+    job.file.save(f"{job.pk}.pdf", ContentFile(data), save=False)
+    job.status = PdfJob.Status.DONE
+    job.finished_at = now()
+    job.save(update_fields=["file", "status", "finished_at"])
+
+
+def delete_old_jobs(max_age: dt.timedelta) -> int:
+    """Delete the finished jobs (and their files) older than `max_age`."""
+    jobs = PdfJob.objects.filter(
+        status__in=(PdfJob.Status.DONE, PdfJob.Status.FAILED),
+        finished_at__lt=now() - max_age,
+    )
+    count = 0
+    for job in jobs.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        count += 1
+    return count
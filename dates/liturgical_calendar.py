@@ -1,21 +1,27 @@
 import datetime as dt
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Iterator
 
 from dateutil.easter import easter as easter_date_for
 
 
+def _sunday_on_or_before(date: dt.date) -> dt.date:
+    """Return the Sunday on or before the date."""
+    return date - dt.timedelta(days=(date.weekday() + 1) % 7)
+
+
+def _get_advent_start(year: int) -> dt.date:
+    """Return the 1st Sunday of Advent of the year (the 4th Sunday before Christmas)."""
+    return _sunday_on_or_before(dt.date(year, 12, 24)) - dt.timedelta(weeks=3)
+
+
 def get_liturgical_year(date: dt.date):
     """Return the liturgical year of the date."""
     if isinstance(date, dt.datetime):
         date = date.date()  # otherwise the final comparison doesn't work
 
-    christmas = dt.date(date.year, 12, 25)
-
-    advent_start = christmas - dt.timedelta(days=1)
-    while advent_start.weekday() != 6:
-        advent_start -= dt.timedelta(days=1)
-    advent_start -= dt.timedelta(weeks=3)
-
-    if date < advent_start:
+    if date < _get_advent_start(date.year):
         return date.year - 1
     return date.year
 
@@ -39,25 +45,23 @@ default_translations = {
 }
 
 
+@lru_cache(maxsize=64)
 def get_movable_feasts_for(year: int) -> dict[dt.date, tuple[str, dict[str, str | int]]]:
-    """Returns the movable feasts for the specified liturgical year."""
+    """
+    Returns the movable feasts for the specified liturgical year.
+
+    The result is memoized, it must not be modified.
+    """
 
     # Key dates needed to calculate the other ones
     christmas = dt.date(year, 12, 25)
-
-    advent_start = christmas - dt.timedelta(days=1)
-    while advent_start.weekday() != 6:
-        advent_start -= dt.timedelta(days=1)
-    advent_start -= dt.timedelta(weeks=3)
+    advent_start = _get_advent_start(year)
 
     easter = easter_date_for(year + 1)
     ash_wednesday = easter - dt.timedelta(days=46)
     pentecost = easter + dt.timedelta(days=49)
 
-    christ_king = dt.date(year + 1, 12, 24)
-    while christ_king.weekday() != 6:
-        christ_king -= dt.timedelta(days=1)
-    christ_king -= dt.timedelta(weeks=4)
+    christ_king = _get_advent_start(year + 1) - dt.timedelta(weeks=1)
 
     mobile_dates = {}
     current_date = advent_start
@@ -161,3 +165,39 @@ def get_movable_feasts_for(year: int) -> dict[dt.date, tuple[str, dict[str, str
         mobile_dates[date] = ("ordinary_time_sunday", {"n": n + to_add})
 
     return dict(sorted(mobile_dates.items(), key=lambda item: item[0]))
+
+
+@lru_cache(maxsize=64)
+def _get_feasts_index(year: int) -> dict[str, tuple[list[dt.date], list[dict[str, str | int]]]]:
+    """Returns the sorted dates (and their parameters) of each movable feast of the liturgical year."""
+    index = {}
+    for date, (slug, params) in get_movable_feasts_for(year).items():
+        dates, all_params = index.setdefault(slug, ([], []))
+        dates.append(date)
+        all_params.append(params)
+    return index
+
+
+def get_feast_dates(slug: str, start: dt.date, end: dt.date | None = None) -> Iterator[tuple[dt.date, dict[str, str | int]]]:
+    """
+    Yields the dates (and their parameters) of a movable feast between `start` and `end` (included).
+
+    If `end` is None, the dates are yielded indefinitely.
+    """
+    if isinstance(start, dt.datetime):
+        start = start.date()
+    if isinstance(end, dt.datetime):
+        end = end.date()
+
+    year = get_liturgical_year(start)
+    while True:
+        feasts = get_movable_feasts_for(year)
+        if end and next(iter(feasts)) > end:
+            return
+        dates, all_params = _get_feasts_index(year).get(slug, ((), ()))
+        lo = bisect_left(dates, start)
+        hi = bisect_right(dates, end) if end else len(dates)
+        for i in range(lo, hi):
+            yield dates[i], all_params[i]
+        year += 1
+
@@ -0,0 +1,123 @@
+import datetime as dt
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dates.models import Config, Date, Week
+from dates.pdfs.feuille_annonces import FeuilleAnnonces
+
+# Week of the synthetic dates, far from the real ones
+BENCHMARK_WEEK = Week(dt.date(2100, 1, 4))
+
+# Titles with all the text styles of the PDFs (superscripts, links, phone numbers, emails)
+TITLES = [
+    "Messe du 1er dimanche à Embrun, suivie d'un verre de l'amitié sur le parvis de la cathédrale",
+    "Réunion de préparation au baptême, inscriptions au 04 92 43 00 00 ou à secretariat@example.org",
+    "Catéchisme des enfants de CE2 et CM1 (2e année), informations sur https://www.example.org/catechisme",
+    "Adoration eucharistique et confessions jusqu'à la messe du soir, au XXIe siècle comme au XIIe",
+    "Répétition de la chorale paroissiale pour la fête patronale, contact : +33 6 12 34 56 78",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the rendering of FeuilleAnnonces with synthetic dates and compare it with the saved baselines. "
+        "Fails if a measure is worse than its baseline times the threshold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=lambda value: [int(size) for size in value.split(",")],
+            default=[10, 100, 1000],
+            help="Comma-separated numbers of dates in the week (10,100,1000 by default).",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Number of renders of each size (the median is kept).")
+        parser.add_argument(
+            "--baselines",
+            type=Path,
+            default=Path(settings.BASE_DIR) / "benchmarks.json",
+            help="JSON file of the baselines.",
+        )
+        parser.add_argument("--threshold", type=float, default=1.25, help="Maximum ratio to the baselines.")
+        parser.add_argument("--save", action="store_true", help="Save the results as the new baselines.")
+
+    def handle(self, *args, sizes, repeat, baselines, threshold, save=False, verbosity=1, **options):
+        if not Config.objects.exists():
+            raise CommandError("The configuration (name and logo) must be filled in before running the benchmarks.")
+
+        results = {}
+        for size in sizes:
+            results[str(size)] = self.benchmark(size, repeat)
+
+        saved = json.loads(baselines.read_text()) if baselines.exists() else {}
+        regressions = []
+        for size, result in results.items():
+            baseline = saved.get(size, {})
+            line = []
+            for measure, unit in (("time", "s"), ("peak_memory", "B"), ("output_size", "B")):
+                value = result[measure]
+                line.append(f"{measure} = {value:.3f}{unit}" if unit == "s" else f"{measure} = {value}{unit}")
+                if measure in baseline:
+                    ratio = value / baseline[measure]
+                    line[-1] += f" (x{ratio:.2f})"
+                    if ratio > threshold:
+                        regressions.append(f"{measure} of {size} dates is x{ratio:.2f} its baseline")
+            if verbosity:
+                self.stdout.write(f"{size:>5} dates: " + ", ".join(line))
+
+        if save:
+            baselines.write_text(json.dumps({**saved, **results}, indent=4) + "\n")
+            if verbosity:
+                self.stdout.write(f"Saved the baselines in {baselines}")
+        elif regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+
+    def benchmark(self, size: int, repeat: int) -> dict[str, float | int]:
+        with transaction.atomic():
+            self.seed(size)
+
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output = self.render()
+                times.append(time.perf_counter() - start)
+
+            # Separate render, tracemalloc slows everything down
+            tracemalloc.start()
+            try:
+                self.render()
+                _current, peak_memory = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            transaction.set_rollback(True)
+
+        return {
+            "time": statistics.median(times),
+            "peak_memory": peak_memory,
+            "output_size": len(output),
+        }
+
+    def seed(self, size: int):
+        """Add `size` dates to the benchmark week (no signal is sent, so nothing is cached with them)."""
+        Date.objects.bulk_create(
+            Date(
+                _title=TITLES[i % len(TITLES)],
+                start_date=BENCHMARK_WEEK.start + dt.timedelta(days=i % 7),
+                _start_time=dt.time(8 + i % 12, 30 * (i % 2)),
+                _end_time=dt.time(9 + i % 12, 30 * (i % 2)),
+            )
+            for i in range(size)
+        )
+
+    def render(self) -> bytes:
+        pdf = FeuilleAnnonces()
+        pdf.render(str(BENCHMARK_WEEK))
+        return bytes(pdf.output())
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from dates.pdfs.fonts import FONTS_DIR, STYLES, download_montserrat_font
+
+
+class Command(BaseCommand):
+    help = "Download the fonts used in the PDFs, so that they are never downloaded while rendering."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Download the fonts even if they already exist.")
+
+    def handle(self, *args, force=False, verbosity=1, **options):
+        for style in STYLES:
+            file = download_montserrat_font(style, force=force)
+            if verbosity:
+                self.stdout.write(f"{file.relative_to(FONTS_DIR)}")
@@ -0,0 +1,45 @@
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dates.ical_import import Importer, iter_events
+
+
+class Command(BaseCommand):
+    help = "Import the events of .ics files, skipping the ones that already exist (see dates.ical_import)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", type=Path, help=".ics files to import.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of events inserted in each transaction.")
+
+    def handle(self, *args, files, batch_size=1000, verbosity=1, **options):
+        if batch_size < 1:
+            raise CommandError("The batch size must be positive")
+
+        importer = Importer(batch_size)
+        started = time.perf_counter()
+        for path in files:
+            before = importer.stats.copy()
+            file_started = time.perf_counter()
+            try:
+                with path.open(encoding="utf-8-sig") as f:
+                    importer.import_events(iter_events(f))
+            except OSError as err:
+                raise CommandError(err) from err
+            if verbosity:
+                self.report(str(path), importer.stats - before, time.perf_counter() - file_started)
+
+        importer.finish()
+        if verbosity:
+            if importer.stats["orphans"]:
+                self.stdout.write(f"{importer.stats['orphans']} instance(s) without their recurrence handled as separate dates")
+            if len(files) > 1:
+                self.report("Total", importer.stats, time.perf_counter() - started)
+
+    def report(self, name: str, stats: Counter, elapsed: float):
+        self.stdout.write(
+            f"{name}: {stats['events']} event(s), {stats['created']} created, {stats['duplicates']} duplicate(s), "
+            + f"{stats['invalid']} invalid in {elapsed:.1f} s ({stats['events'] / max(elapsed, 1e-6):.0f} events/s)"
+        )
@@ -0,0 +1,59 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dates.pdfs.feuille_annonces import FeuilleAnnonces
+
+
+class Command(BaseCommand):
+    help = "Render the bulletins of the current and next weeks in MEDIA_ROOT when their data changes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--weeks", type=int, default=4, help="Number of weeks to render after the current one.")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and check for changes every INTERVAL seconds (run once if 0).",
+        )
+
+    def handle(self, *args, weeks=4, interval=0, verbosity=1, **options):
+        while True:
+            try:
+                self.prerender(weeks, verbosity)
+            except Exception:
+                if not interval:
+                    raise
+                # E.g. no configuration yet or a lost database connection: try again at the next check
+                self.stderr.write(f"The bulletins could not be rendered:\n{traceback.format_exc()}")
+                close_old_connections()
+            if not interval:
+                return
+            time.sleep(interval)
+
+    def prerender(self, weeks: int, verbosity: int):
+        current_paths = set()
+        for offset in range(weeks + 1):
+            week = str(FeuilleAnnonces.get_week(offset))
+            key, _last_modified = FeuilleAnnonces.get_versioned_key(week)
+            path = FeuilleAnnonces.get_prerendered_path(key)
+            current_paths.add(path)
+            if path.exists():
+                continue
+
+            pdf = FeuilleAnnonces()
+            pdf.render(week)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so that nginx never sends a partial file
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(bytes(pdf.output()))
+            tmp.replace(path)
+            if verbosity:
+                self.stdout.write(f"Rendered the week of {week}")
+
+        # Remove the outdated documents
+        for path in FeuilleAnnonces.get_prerendered_path("").parent.glob("*.pdf"):
+            if path not in current_paths:
+                path.unlink(missing_ok=True)
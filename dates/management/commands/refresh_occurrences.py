@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from dates.models import Recurrence
+from dates.occurrences import extend, get_horizon, materialize
+
+
+class Command(BaseCommand):
+    help = "Extend the precomputed occurrences of the recurrences up to the rolling horizon."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute all the occurrences instead of only adding the missing ones.",
+        )
+
+    def handle(self, *args, rebuild=False, verbosity=1, **options):
+        _start, end = get_horizon()
+        count = 0
+        for recurrence in Recurrence.objects.all():
+            if rebuild:
+                materialize(recurrence)
+            else:
+                extend(recurrence, end)
+            count += 1
+        if verbosity:
+            self.stdout.write(f"Refreshed the occurrences of {count} recurrence(s) up to {end}.")
@@ -0,0 +1,46 @@
+import datetime as dt
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dates.bundles import create_pool, get_weeks, iter_rendered_weeks, iter_zip, render_merged
+from dates.models import Week
+
+
+class Command(BaseCommand):
+    help = "Render the bulletins of several weeks in parallel, in one PDF or in a ZIP file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=dt.date.fromisoformat, help="A date of the first week (the current week by default).")
+        parser.add_argument("--end", type=dt.date.fromisoformat, help="A date of the last week (the first week by default).")
+        parser.add_argument("--format", choices=("pdf", "zip"), default="pdf", help="Merge the weeks in one PDF or put them in a ZIP file.")
+        parser.add_argument("--workers", type=int, help="Number of worker processes (the number of CPUs by default).")
+        parser.add_argument("-o", "--output", type=Path, help="Output file (named after the weeks by default).")
+
+    def handle(self, *args, start=None, end=None, format="pdf", workers=None, output=None, verbosity=1, **options):
+        start = start or Week.get_current().start
+        try:
+            weeks = get_weeks(start, end or start)
+        except ValueError as err:
+            raise CommandError(err) from err
+
+        output = output or Path(f"feuilles-annonces-{weeks[0]}-{weeks[-1]}.{format}")
+        pool = create_pool(workers)
+        try:
+            if format == "zip":
+                with output.open("wb") as f:
+                    for chunk in iter_zip(self.log(iter_rendered_weeks(weeks, pool), verbosity)):
+                        f.write(chunk)
+            else:
+                output.write_bytes(render_merged(weeks, pool))
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+        if verbosity:
+            self.stdout.write(f"Rendered {len(weeks)} week(s) in {output}")
+
+    def log(self, documents, verbosity):
+        for week, document in documents:
+            if verbosity > 1:
+                self.stdout.write(f"Rendered the week of {week}")
+            yield week, document
@@ -0,0 +1,49 @@
+import datetime as dt
+import time
+
+from django.core.management.base import BaseCommand
+
+from dates.jobs import claim_next, delete_old_jobs, run
+
+
+class Command(BaseCommand):
+    help = "Render the PDFs requested in the background (see dates.jobs)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Stop when there is no pending job.")
+        parser.add_argument("--interval", type=float, default=1, help="Seconds between two checks of the queue.")
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            default=600,
+            help="Seconds after which a running job is considered lost and is taken again.",
+        )
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=24 * 3600,
+            help="Seconds after which the finished jobs and their files are deleted.",
+        )
+
+    def handle(self, *args, once=False, interval=1, timeout=600, max_age=24 * 3600, verbosity=1, **options):
+        timeout = dt.timedelta(seconds=timeout)
+        max_age = dt.timedelta(seconds=max_age)
+        while True:
+            job = claim_next(timeout)
+            if job is None:
+                deleted = delete_old_jobs(max_age)
+                if deleted and verbosity:
+                    self.stdout.write(f"Deleted {deleted} old job(s)")
+                if once:
+                    return
+                time.sleep(interval)
+                continue
+
+            try:
+                run(job)
+            except Exception as err:
+                # The error is saved on the job, keep running the other ones
+                self.stderr.write(f"Job {job.pk} ({job.document}) failed: {err!r}")
+            else:
+                if verbosity:
+                    self.stdout.write(f"Rendered job {job.pk} ({job.document})")
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dates", "0013_date_cancelled_date_note"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recurrence",
+            name="materialized_from",
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="recurrence",
+            name="materialized_until",
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name="VirtualOccurrence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("start_date", models.DateField()),
+                ("start_time", models.TimeField(blank=True, null=True)),
+                ("end_time", models.TimeField(blank=True, null=True)),
+                (
+                    "recurrence",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="virtual_occurrences",
+                        to="dates.recurrence",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["start_date", "start_time"],
+                        name="dates_virtu_start_d_590cd9_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("recurrence", "start_date"),
+                        name="unique_virtual_occurrence",
+                    )
+                ],
+            },
+        ),
+    ]
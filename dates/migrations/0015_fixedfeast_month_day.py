@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:09
+
+import datetime as dt
+
+from dateutil.rrule import rrulestr
+from django.db import migrations, models
+
+
+# Frozen copy of `dates.utils.get_yearly_month_day`, the migration must not change with the app code
+def get_yearly_month_day(text):
+    try:
+        rrulestr(text, forceset=True)
+    except (KeyError, ValueError, TypeError):
+        return None
+
+    start = None
+    rules = []
+    for line in text.upper().split():
+        name, _, value = line.partition(":") if ":" in line else ("RRULE", "", line)
+        name = name.split(";")[0]
+        if name == "DTSTART":
+            start = dt.datetime.strptime(value[:8], "%Y%m%d").date()
+        elif name == "RRULE":
+            rules.append(value)
+        else:
+            return None
+    if len(rules) != 1:
+        return None
+
+    parts = dict(part.partition("=")[::2] for part in rules[0].split(";"))
+    allowed = {"FREQ", "INTERVAL", "BYMONTH", "BYMONTHDAY", "BYHOUR", "BYMINUTE", "BYSECOND", "WKST"}
+    if parts.get("FREQ") != "YEARLY" or parts.get("INTERVAL", "1") != "1" or not parts.keys() <= allowed:
+        return None
+    if "," in parts.get("BYMONTH", "") or "," in parts.get("BYMONTHDAY", ""):
+        return None
+
+    day = int(parts["BYMONTHDAY"]) if "BYMONTHDAY" in parts else start and start.day
+    month = int(parts["BYMONTH"]) if "BYMONTH" in parts else "BYMONTHDAY" not in parts and start and start.month
+    if not month or not day or day < 0:
+        return None
+
+    return month, day, start
+
+
+def compile_fixed_feasts(apps, schema_editor):
+    """
+    Fills the day of the year of the existing fixed feasts.
+    """
+    FixedFeast = apps.get_model("dates", "FixedFeast")
+    for feast in FixedFeast.objects.all():
+        feast.month, feast.day, feast.since = get_yearly_month_day(feast.recurrence) or (None, None, None)
+        feast.save(update_fields=["month", "day", "since"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dates", "0014_virtualoccurrence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fixedfeast",
+            name="day",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fixedfeast",
+            name="month",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fixedfeast",
+            name="since",
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="fixedfeast",
+            index=models.Index(
+                fields=["month", "day"], name="dates_fixed_month_ceb4b0_idx"
+            ),
+        ),
+        migrations.RunPython(compile_fixed_feasts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dates", "0018_calendarchange"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="date",
+            name="uid",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=255
+            ),
+        ),
+        migrations.AddField(
+            model_name="recurrence",
+            name="uid",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=255
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dates", "0019_date_uid_recurrence_uid"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="virtualoccurrence",
+            name="unique_virtual_occurrence",
+        ),
+        migrations.AddConstraint(
+            model_name="virtualoccurrence",
+            constraint=models.UniqueConstraint(
+                fields=("recurrence", "start_date", "start_time"),
+                name="unique_virtual_occurrence",
+            ),
+        ),
+    ]
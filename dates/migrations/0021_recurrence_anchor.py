@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:56
+
+import dates.models
+from django.db import migrations, models
+from django.db.models import F
+
+
+def keep_materialized_anchor(apps, schema_editor):
+    """
+    The stored occurrences of the rules without DTSTART were anchored on the start of their range:
+    keep it so that they don't change.
+    """
+    Recurrence = apps.get_model("dates", "Recurrence")
+    Recurrence.objects.filter(materialized_from__isnull=False).update(anchor=F("materialized_from"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dates", "0020_virtualoccurrence_start_time"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recurrence",
+            name="anchor",
+            field=models.DateField(
+                default=dates.models.get_default_anchor, editable=False
+            ),
+        ),
+        migrations.RunPython(keep_materialized_anchor, migrations.RunPython.noop),
+    ]
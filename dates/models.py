@@ -1,19 +1,21 @@
 import datetime as dt
+import uuid
 from functools import total_ordering
 from html import escape
 from string import Template
 from typing import Generator, Union
 
-from dateutil.rrule import rrulestr
+from django.core import signing
 from django.db import models
 from django.utils.safestring import mark_safe
 from django.utils.timezone import get_current_timezone, make_aware, make_naive, now
 from solo.models import SingletonModel
 
+from .cache import rule_cache
 from .fields import RecurrenceField
-from .liturgical_calendar import default_translations, get_liturgical_year, get_movable_feasts_for
+from .liturgical_calendar import default_translations, get_feast_dates
 from .ordinal import ordinal
-from .utils import date_to_datetime, format_date_or_time
+from .utils import date_to_datetime, format_date_or_time, get_yearly_month_day
 
 
 class Celebrant(models.Model):
@@ -100,10 +102,35 @@ class Config(SingletonModel):
     logo = models.ImageField()
 
 
+def normalize_range(start: dt.date | DateRange, end: dt.date | None, inc: bool):
+    """Normalise les bornes acceptées par `HasOccurrences.get_occurrences`."""
+    if isinstance(start, DateRange):
+        week = start
+        start = week.start
+        end = week.end
+        inc = True
+
+    if isinstance(start, dt.datetime):
+        start = start.date()
+    if isinstance(end, dt.datetime):
+        end = end.date()
+
+    return start, end, inc
+
+
+def get_start(occurrence: "Date") -> dt.datetime:
+    """Retourne le moment où commence une occurrence (minuit si elle dure toute la journée)."""
+    return dt.datetime.combine(occurrence.start_date, occurrence.start_time or dt.time.min)
+
+
+CURSOR_SALT = "dates.models.OccurrencesList.cursor"
+
+
 class OccurrencesList(list["Date"]):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.ended = True
+        self.cursor: str | None = None
 
     @classmethod
     def from_iterable(cls, iterable, limit=20):
@@ -117,29 +144,83 @@ class OccurrencesList(list["Date"]):
         ret.ended = False
         return ret
 
+    @staticmethod
+    def make_cursor(start: dt.date, end: dt.date | None, inc: bool, after: dt.datetime) -> str:
+        """Retourne un curseur opaque permettant de reprendre après l'occurrence commençant à `after`."""
+        return signing.dumps(
+            [start.isoformat(), end.isoformat() if end else None, inc, after.isoformat()],
+            salt=CURSOR_SALT,
+            compress=True,
+        )
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> tuple[dt.date, dt.date | None, bool, dt.datetime]:
+        """Décode un curseur créé par `make_cursor`."""
+        try:
+            start, end, inc, after = signing.loads(cursor, salt=CURSOR_SALT)
+            return (
+                dt.date.fromisoformat(start),
+                dt.date.fromisoformat(end) if end else None,
+                bool(inc),
+                dt.datetime.fromisoformat(after),
+            )
+        except (signing.BadSignature, TypeError, ValueError) as err:
+            raise ValueError("Invalid cursor") from err
+
 
 class HasOccurrences:
-    def get_occurrences(self, start: dt.date | DateRange, end: dt.date | None = None, inc=False, limit=20):
-        """Retourne toutes les occurrences d'un événement récurrent."""
-        if isinstance(start, DateRange):
-            week = start
-            start = week.start
-            end = week.end
-            inc = True
+    def get_occurrences(
+        self,
+        start: dt.date | DateRange | None = None,
+        end: dt.date | None = None,
+        inc=False,
+        limit=20,
+        cursor: str | None = None,
+    ):
+        """
+        Retourne toutes les occurrences d'un événement récurrent.
+
+        Si la liste est tronquée, son attribut `cursor` permet d'obtenir la suite
+        (en le passant à la place de `start`, `end` et `inc`).
+        """
+        after = None
+        if cursor:
+            start, end, inc, after = OccurrencesList.parse_cursor(cursor)
+        else:
+            start, end, inc = normalize_range(start, end, inc)
 
-        if isinstance(start, dt.datetime):
-            start = start.date()
-        if isinstance(end, dt.datetime):
-            end = end.date()
+        ret = OccurrencesList.from_iterable(self.iter_occurrences(start, end, inc, after=after), max(1, limit))
+        if not ret.ended and ret:
+            ret.cursor = OccurrencesList.make_cursor(start, end, inc, get_start(ret[-1]))
+        return ret
 
-        def real_get_occurrences():
-            for occurrence in self._get_occurrences(start, end):
-                if occurrence.contains(start, end, inc):
-                    yield occurrence
+    def iter_occurrences(
+        self,
+        start: dt.date | DateRange,
+        end: dt.date | None = None,
+        inc=False,
+        after: dt.datetime | None = None,
+    ):
+        """
+        Génère les occurrences d'un événement récurrent au fur et à mesure, sans limite.
+
+        Si `after` est donné, seules les occurrences qui commencent strictement après
+        ce moment sont générées (il peut y en avoir plusieurs le même jour).
+        """
+        start, end, inc = normalize_range(start, end, inc)
+
+        day_before = after.date() - dt.timedelta(days=1) if after else None
+        for occurrence in self._get_occurrences(start, end, day_before):
+            if after and get_start(occurrence) <= after:
+                continue
+            if occurrence.contains(start, end, inc):
+                yield occurrence
 
-        return OccurrencesList.from_iterable(real_get_occurrences(), limit)
+    def get_anchor(self, start: dt.date) -> dt.date:
+        """Retourne le début des règles sans DTSTART quand les occurrences sont demandées à partir de `start`."""
+        return start
 
-    def _get_occurrences(self, start: dt.date, end: dt.date | None) -> Generator["Date", None, None]:
+    def _get_occurrences(self, start: dt.date, end: dt.date | None, after: dt.date | None = None) -> Generator["Date", None, None]:
         if not hasattr(self, "recurrence"):
             raise NotImplementedError(
                 "To be able to use the default implementation of _get_occurrences, there must be "
@@ -150,21 +231,30 @@ class HasOccurrences:
         if isinstance(start, dt.datetime) or isinstance(end, dt.datetime):
             raise TypeError("start or end can't be datetimes, they must be dates")
 
-        occurrences_list = rrulestr(self.recurrence, dtstart=start, forceset=True)
-        for occurrence in occurrences_list.xafter(dt.datetime.combine(start, dt.time.min), inc=True):
-            if start and occurrence.date() < start:
+        # The rule stays anchored on the same date, only the iteration is resumed after `after`
+        occurrences_list = rule_cache.get(self, self.recurrence, self.get_anchor(start))
+        first_day = max(start, after + dt.timedelta(days=1)) if after else start
+        for occurrence in occurrences_list.xafter(dt.datetime.combine(first_day, dt.time.min), inc=True):
+            if occurrence.date() < first_day:
                 continue
             if end and occurrence.date() > end:
                 break
             if isinstance(self, Recurrence):
-                yield Date(event=self, start_date=occurrence.date())
+                # The rules give the days at midnight, unless they repeat several times a day (BYHOUR...)
+                time = occurrence.time()
+                yield Date(event=self, start_date=occurrence.date(), _start_time=time if time != dt.time.min else None)
             else:
-                yield Date(event=Recurrence(title=self.name), start_date=occurrence.date())
+                date = Date(event=Recurrence(title=self.name), start_date=occurrence.date())
+                date.is_feast = True
+                yield date
 
 
 class Date(HasOccurrences, models.Model):
     objects = DateManager()
 
+    # True for the occurrences of the fixed and movable feasts
+    is_feast = False
+
     event: models.ForeignKey["Recurrence"] = models.ForeignKey("Recurrence", on_delete=models.CASCADE, null=True, blank=True)
     _title = models.CharField(db_column="title", max_length=200, blank=True)
     start_date = models.DateField()
@@ -176,6 +266,8 @@ class Date(HasOccurrences, models.Model):
     celebrant = models.ForeignKey(Celebrant, null=True, on_delete=models.SET_NULL)
     cancelled = models.BooleanField("Annulé", default=False)
     ignored = models.BooleanField(default=False)
+    # UID of the imported event (see `dates.ical_import`)
+    uid = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
 
     @property
     def title(self) -> str:
@@ -270,11 +362,30 @@ class Date(HasOccurrences, models.Model):
         return [self]
 
 
+def get_default_anchor() -> dt.date:
+    """Début des règles sans DTSTART d'une nouvelle récurrence : le début des occurrences précalculées."""
+    from .occurrences import get_horizon
+
+    return get_horizon()[0]
+
+
 class Recurrence(HasOccurrences, models.Model):
     title = models.CharField(max_length=200)
     start_time = models.TimeField(null=True, blank=True)
     end_time = models.TimeField(null=True, blank=True)
     recurrence = RecurrenceField()
+    # UID of the imported event (see `dates.ical_import`)
+    uid = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
+
+    # Range covered by the `VirtualOccurrence`s of this recurrence (see `dates.occurrences`)
+    materialized_from = models.DateField(null=True, editable=False)
+    materialized_until = models.DateField(null=True, editable=False)
+    # Start of the rules without DTSTART (like the ones of the admin widget): the same one is used
+    # for every range, otherwise the rules with an INTERVAL or a COUNT would depend on the range
+    anchor = models.DateField(default=get_default_anchor, editable=False)
+
+    def get_anchor(self, start: dt.date) -> dt.date:
+        return self.anchor
 
     def clean(self):
         self.get_occurrences(Week.get_current())
@@ -283,36 +394,64 @@ class Recurrence(HasOccurrences, models.Model):
         return self.title
 
 
+class VirtualOccurrence(models.Model):
+    """Occurrence précalculée d'une récurrence, pour éviter de réévaluer la règle à chaque requête."""
+    recurrence = models.ForeignKey(Recurrence, on_delete=models.CASCADE, related_name="virtual_occurrences")
+    start_date = models.DateField()
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["start_date", "start_time"])]
+        constraints = [
+            models.UniqueConstraint(fields=["recurrence", "start_date", "start_time"], name="unique_virtual_occurrence"),
+        ]
+
+    def as_date(self):
+        start_time = self.start_time if self.start_time != self.recurrence.start_time else None
+        return Date(event=self.recurrence, start_date=self.start_date, _start_time=start_time)
+
+
 class FixedFeast(HasOccurrences, models.Model):
     name = models.CharField(max_length=200)
     recurrence = RecurrenceField()
 
+    # Day of the year of the simple yearly rules (see `dates.occurrences.iter_fixed_feast_occurrences`),
+    # None for the other rules
+    month = models.PositiveSmallIntegerField(null=True, editable=False)
+    day = models.PositiveSmallIntegerField(null=True, editable=False)
+    since = models.DateField(null=True, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["month", "day"])]
+
+    def save(self, *args, **kwargs):
+        self.month, self.day, self.since = get_yearly_month_day(self.recurrence) or (None, None, None)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "recurrence" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "month", "day", "since"}
+        super().save(*args, **kwargs)
+
 
 class MovableFeast(HasOccurrences, models.Model):
     slug = models.SlugField(unique=True)
     display_name = models.CharField(max_length=200)
 
-    def _get_occurrences(self, start: dt.date, end: dt.date | None):
+    def _get_occurrences(self, start: dt.date, end: dt.date | None, after: dt.date | None = None):
         if self.slug not in default_translations:
             return  # avoid iterating until the end of the date range (year 10000)
-        liturgical_year = get_liturgical_year(start)
-        ended = False
-        while not ended:
-            for date, (slug, params) in get_movable_feasts_for(liturgical_year).items():
-                if date < start:
-                    continue
-                if end and date > end:
-                    ended = True
-                    break
-                if slug != self.slug:
-                    continue
-                if "n" in params:
-                    params["ord"] = ordinal(params["n"])
-                yield Date(
-                    _title=Template(self.display_name or default_translations[slug]).substitute(params),
-                    start_date=date,
-                )
-            liturgical_year += 1
+        if after:
+            start = max(start, after + dt.timedelta(days=1))
+        for date, params in get_feast_dates(self.slug, start, end):
+            if "n" in params:
+                # don't modify the memoized parameters
+                params = {**params, "ord": ordinal(params["n"])}
+            occurrence = Date(
+                _title=Template(self.display_name or default_translations[self.slug]).substitute(params),
+                start_date=date,
+            )
+            occurrence.is_feast = True
+            yield occurrence
 
 
 class Bulletin(models.Model):
@@ -324,3 +463,38 @@ class Bulletin(models.Model):
     type = models.CharField(max_length=15, choices=BulletinType.choices)
     days_before = models.IntegerField(default=0)
     days_after = models.IntegerField(default=0)
+
+
+class DataVersion(models.Model):
+    """Compteur de modifications d'un modèle, pour savoir si un rendu mis en cache est encore valide."""
+    name = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=now)
+
+
+class CalendarChange(models.Model):
+    """Dernière modification d'une ressource du calendrier CalDAV (voir `dates.caldav`)."""
+    name = models.CharField(max_length=100, unique=True)
+    changed_at = models.DateTimeField(default=now)
+
+
+class PdfJob(models.Model):
+    """Rendu d'un PDF demandé en arrière-plan (voir `dates.jobs`)."""
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        RUNNING = "RUNNING", "Running"
+        DONE = "DONE", "Done"
+        FAILED = "FAILED", "Failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    document = models.CharField(max_length=50)
+    arguments = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    file = models.FileField(upload_to="jobs/", blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
@@ -0,0 +1,228 @@
+"""
+Occurrences of the recurrences and feasts.
+
+The occurrences of each `Recurrence` are stored as `VirtualOccurrence` rows over a rolling horizon
+(`OCCURRENCES_HISTORY` before the current week, `OCCURRENCES_HORIZON` after today), so that the lists
+only need one indexed range query instead of evaluating every rule on every request.
+
+`iter_occurrences` merges them with the stored dates and the feasts in a single sorted stream.
+"""
+
+import datetime as dt
+import heapq
+from typing import Iterator
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, QuerySet
+from django.db.models.functions import Coalesce
+from django.utils.timezone import localdate
+
+from .models import Date, DateRange, FixedFeast, MovableFeast, Recurrence, VirtualOccurrence, Week, normalize_range
+
+
+def get_horizon() -> tuple[dt.date, dt.date]:
+    """Return the range of dates that should be materialized."""
+    today = localdate()
+    return (
+        Week(today).start - getattr(settings, "OCCURRENCES_HISTORY", dt.timedelta(weeks=8)),
+        today + getattr(settings, "OCCURRENCES_HORIZON", dt.timedelta(days=548)),
+    )
+
+
+def _build(recurrence: Recurrence, start: dt.date, end: dt.date, after: dt.date | None = None):
+    for occurrence in recurrence._get_occurrences(start, end):
+        if after and occurrence.start_date <= after:
+            continue
+        yield VirtualOccurrence(
+            recurrence=recurrence,
+            start_date=occurrence.start_date,
+            start_time=occurrence.start_time,
+            end_time=recurrence.end_time,
+        )
+
+
+def materialize(recurrence: Recurrence):
+    """Recompute all the stored occurrences of a recurrence."""
+    start, end = get_horizon()
+    with transaction.atomic():
+        VirtualOccurrence.objects.filter(recurrence=recurrence).delete()
+        VirtualOccurrence.objects.bulk_create(_build(recurrence, start, end), batch_size=500)
+        # Don't use save() to avoid triggering the post_save signal again
+        Recurrence.objects.filter(pk=recurrence.pk).update(materialized_from=start, materialized_until=end)
+    recurrence.materialized_from = start
+    recurrence.materialized_until = end
+
+
+def extend(recurrence: Recurrence, until: dt.date):
+    """Add the stored occurrences of a recurrence up to `until`."""
+    if recurrence.materialized_from is None or recurrence.materialized_until is None:
+        materialize(recurrence)
+        return
+    if until <= recurrence.materialized_until:
+        return
+    with transaction.atomic():
+        VirtualOccurrence.objects.bulk_create(
+            _build(recurrence, recurrence.materialized_from, until, after=recurrence.materialized_until),
+            batch_size=500,
+        )
+        Recurrence.objects.filter(pk=recurrence.pk).update(materialized_until=until)
+    recurrence.materialized_until = until
+
+
+def materialize_recurrence(sender, instance: Recurrence, raw=False, **_kwargs):
+    """
+    Recomputes the stored occurrences of a saved recurrence.
+    """
+    if raw:
+        return
+    materialize(instance)
+
+
+def sort_key(date: Date):
+    """Sort key of the dates (the all-day dates come first)."""
+    return (date.start_date, date.start_time or dt.time.min)
+
+
+def iter_recurrence_occurrences(start: dt.date | DateRange, end: dt.date | None = None, inc=False) -> Iterator[Date]:
+    """
+    Yield the occurrences of all the recurrences between `start` and `end`, sorted by start.
+
+    The arguments have the same meaning as in `HasOccurrences.get_occurrences`.
+    """
+    start, end, inc = normalize_range(start, end, inc)
+
+    if end is None:
+        # Unbounded range, the rules must be evaluated
+        yield from heapq.merge(
+            *(recurrence.iter_occurrences(start, end, inc) for recurrence in Recurrence.objects.all()),
+            key=sort_key,
+        )
+        return
+
+    covered = Q(materialized_from__lte=start, materialized_until__gte=end)
+    rows = (
+        VirtualOccurrence.objects.filter(
+            start_date__range=(start, end),
+            recurrence__in=Recurrence.objects.filter(covered),
+        )
+        .select_related("recurrence")
+        .order_by("start_date", F("start_time").asc(nulls_first=True))
+    )
+    occurrences = (row.as_date() for row in rows.iterator())
+    occurrences = (occurrence for occurrence in occurrences if occurrence.contains(start, end, inc))
+
+    # Fall back to the rules for the recurrences that are not (fully) materialized
+    yield from heapq.merge(
+        occurrences,
+        *(recurrence.iter_occurrences(start, end, inc) for recurrence in Recurrence.objects.exclude(covered)),
+        key=sort_key,
+    )
+
+
+def iter_fixed_feast_occurrences(start: dt.date | DateRange, end: dt.date | None = None, inc=False) -> Iterator[Date]:
+    """
+    Yield the occurrences of all the fixed feasts between `start` and `end`, sorted by start.
+
+    The feasts that repeat every year on the same day are found with a (month, day) index,
+    only the other ones need their rule to be evaluated.
+    """
+    start, end, inc = normalize_range(start, end, inc)
+
+    if end is None:
+        yield from heapq.merge(
+            *(feast.iter_occurrences(start, end, inc) for feast in FixedFeast.objects.all()),
+            key=sort_key,
+        )
+        return
+
+    days = [start + dt.timedelta(days=i) for i in range((end - start).days + 1)]
+    indexed = FixedFeast.objects.filter(month__isnull=False)
+    if len(days) < 366:
+        month_days = Q()
+        for month, day in {(day.month, day.day) for day in days}:
+            month_days |= Q(month=month, day=day)
+        indexed = indexed.filter(month_days)
+
+    index: dict[tuple[int, int], list[FixedFeast]] = {}
+    for feast in indexed.order_by("pk"):
+        index.setdefault((feast.month, feast.day), []).append(feast)
+
+    def indexed_occurrences():
+        for day in days:
+            for feast in index.get((day.month, day.day), ()):
+                if feast.since and day < feast.since:
+                    continue
+                occurrence = Date(event=Recurrence(title=feast.name), start_date=day)
+                occurrence.is_feast = True
+                if occurrence.contains(start, end, inc):
+                    yield occurrence
+
+    yield from heapq.merge(
+        indexed_occurrences(),
+        *(feast.iter_occurrences(start, end, inc) for feast in FixedFeast.objects.filter(month__isnull=True)),
+        key=sort_key,
+    )
+
+
+def iter_feast_occurrences(start: dt.date | DateRange, end: dt.date | None = None, inc=False) -> Iterator[Date]:
+    """
+    Yield the occurrences of all the fixed and movable feasts between `start` and `end`, sorted by start.
+    """
+    yield from heapq.merge(
+        iter_fixed_feast_occurrences(start, end, inc),
+        *(feast.iter_occurrences(start, end, inc) for feast in MovableFeast.objects.all()),
+        key=sort_key,
+    )
+
+
+def iter_occurrences(
+    start: dt.date | DateRange,
+    end: dt.date | None = None,
+    inc=False,
+    *,
+    queryset: QuerySet[Date] | None = None,
+    include_stored=True,
+    recurrences=True,
+    feasts=True,
+) -> Iterator[Date]:
+    """
+    Lazily yield, sorted by start:
+    * the stored dates of `queryset` that start between `start` and `end` (included),
+      unless `include_stored` is False;
+    * if `recurrences` is True, the occurrences of the recurrences that are not overridden
+      by one of the dates of `queryset`;
+    * if `feasts` is True, the occurrences of the fixed and movable feasts.
+
+    The streams are merged with a heap, so the consumers can stop at any time
+    and the occurrences are never all held in memory.
+    """
+    start, end, inc = normalize_range(start, end, inc)
+
+    streams = []
+    overridden = set()
+
+    if queryset is not None:
+        stored = queryset.filter(start_date__gte=start)
+        if end is not None:
+            stored = stored.filter(start_date__lte=end)
+        if recurrences:
+            overridden = set(stored.filter(event__isnull=False).values_list("event_id", "start_date"))
+        if include_stored:
+            stored = stored.select_related("event").order_by(
+                "start_date",
+                Coalesce("_start_time", "event__start_time").asc(nulls_first=True),
+            )
+            streams.append(stored.iterator())
+
+    if recurrences:
+        streams.append(
+            occurrence
+            for occurrence in iter_recurrence_occurrences(start, end, inc)
+            if (occurrence.event.pk, occurrence.start_date) not in overridden
+        )
+
+    if feasts:
+        streams.append(iter_feast_occurrences(start, end, inc))
+
+    return heapq.merge(*streams, key=sort_key)
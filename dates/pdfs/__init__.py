@@ -1,18 +1,115 @@
+from functools import lru_cache
+import datetime as dt
+import hashlib
 from math import isclose
+from pathlib import Path
 import re
-
-from django.http import HttpResponse
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from fpdf import FPDF, FPDF_VERSION
 from fpdf.enums import Align, CharVPos, XPos, YPos
 from fpdf.fonts import FontFace
+from fpdf.image_datastructures import ImageCache
 from fpdf.image_parsing import preload_image
 from fpdf.line_break import Fragment
 
-from .fonts import get_montserrat_font
-from ..models import Config
+from .fonts import get_montserrat_font, load_font
+from ..jobs import enqueue
+from ..models import Config, Date
+from ..utils import date_to_datetime, format_date_or_time, striptags
+from ..versions import get_data_version, get_version
+
+# Directory (in MEDIA_ROOT) of the documents pre-rendered by the `prerender_bulletins` command
+PRERENDERED_DIR = "pdfs"
+
+# Parts of the text that get a special style, in one regex so that the text is only scanned once
+# (at the same position, the first alternative wins)
+FONT_STYLES_RE = re.compile(
+    "|".join(
+        f"(?P<{name}>{regexp})"
+        for name, regexp in (
+            # https://stackoverflow.com/a/3809435
+            ("link", r"https?:\/\/(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,4}\b[-a-zA-Z0-9@:%_\+.~#?&//=]*"),
+            ("email", r"[\w.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"),
+            ("phone", r"\+\d[\d ]{5,}\d|0\d(?: \d\d){4,}"),
+            ("superscript", r"(?<=[IVX]|\d)(?:e|er|ère|ème|nde)s?\b"),
+        )
+    )
+)
+
+
+@lru_cache(maxsize=4096)
+def split_font_styles(text: str) -> tuple[tuple[str, str | None], ...]:
+    """
+    Split a text into the parts matched by `FONT_STYLES_RE` (with the name of their style)
+    and the parts between them (with None).
+
+    The result is memoized, the same texts come back in every document.
+    """
+    ret = []
+    pos = 0
+    for match in FONT_STYLES_RE.finditer(text):
+        if match.start() > pos:
+            ret.append((text[pos : match.start()], None))
+        ret.append((match.group(), match.lastgroup))
+        pos = match.end()
+    if pos < len(text):
+        ret.append((text[pos:], None))
+    return tuple(ret)
+
+
+# Configuration version of the cached header, and the header
+_header: tuple[int, tuple[Config, str, dict, bytes | None]] | None = None
+_header_lock = threading.Lock()
+
+
+def serve_media_file(name: str, content_type="application/pdf") -> HttpResponse:
+    """Return a file of MEDIA_ROOT, sent by nginx if possible."""
+    if getattr(settings, "USE_X_ACCEL_REDIRECT", False):
+        # Let nginx send the file without holding the worker
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = "/" + f"{settings.MEDIA_URL}{name}".lstrip("/")
+        return response
+    return FileResponse((Path(settings.MEDIA_ROOT) / name).open("rb"), content_type=content_type)
+
+
+def get_header() -> tuple[Config, str, dict, bytes | None]:
+    """
+    Return the configuration, the name of the logo, its decoded image info and its ICC profile.
+
+    They are loaded once per process (the logo can be a large image) and kept until the configuration
+    is saved, in any process: its data version is checked each time.
+    """
+    global _header
+    version = get_version(Config._meta.label)
+    with _header_lock:
+        if _header is None or _header[0] != version:
+            config = Config.objects.get()
+            image_cache = ImageCache()
+            name, _img, info = preload_image(image_cache, config.logo)
+            _header = version, (config, name, info, next(iter(image_cache.icc_profiles), None))
+        return _header[1]
+
+
+def invalidate_header(**_kwargs):
+    """
+    Forgets the cached configuration and logo.
+    """
+    global _header
+    with _header_lock:
+        _header = None
 
 
 class PDF(FPDF):
+    # Name of the document in `dates.jobs.DOCUMENTS`, to render it in the background with a POST
+    document_name: str | None = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -22,6 +119,9 @@ class PDF(FPDF):
 
         self._ncols = 0
 
+        # Measured string widths, by font and text
+        self._string_widths: dict[tuple, float] = {}
+
         self.set_author("Secteur paroissial de l'Embrunais et du Savinois")
         self.set_creator("Générateur de feuilles d'annonces (https://github.com/lfavole/feuilles-annonces)")
         self.set_producer(f"fpdf2 v{FPDF_VERSION} (https://github.com/py-pdf/fpdf2)")
@@ -29,16 +129,13 @@ class PDF(FPDF):
         self.set_margin(10)
         self.set_auto_page_break(True, 10)
 
-        self.font_styles = [
-            (r"((?<=[IVX]|\d)(?:e|er|ère|ème|nde)s?\b)", self._superscript),
-            (r"(\+\d[\d ]{5,}\d|0\d(?: \d\d){4,})", self._phone_link),
-            (r"([\w.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)", self._email_link),
-            # https://stackoverflow.com/a/3809435
-            (
-                r"(https?:\/\/(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,4}\b[-a-zA-Z0-9@:%_\+.~#?&//=]*)",
-                self._link,
-            ),
-        ]
+        # Functions that apply the styles of `FONT_STYLES_RE`
+        self.font_styles = {
+            "superscript": self._superscript,
+            "phone": self._phone_link,
+            "email": self._email_link,
+            "link": self._link,
+        }
 
     def _superscript(self, frag: Fragment):
         frag.graphics_state["char_vpos"] = CharVPos.SUP
@@ -65,20 +162,39 @@ class PDF(FPDF):
         if len(frags) == 1 and not frags[0].characters:
             return frags
 
-        for regexp, function in self.font_styles:
-            ret = []
-            for frag in frags:
-                parts = re.split(regexp, frag.string)
-                for i, part in enumerate(parts):
-                    if not part:
-                        continue
-                    new_frag = Fragment(part, frag.graphics_state.copy(), frag.k, frag.link)
-                    if i % 2 == 1:  # group captured by the split regex
-                        function(new_frag)
-                    ret.append(new_frag)
-            frags = ret  # re-process the fragments
-
-        return frags
+        ret = []
+        for frag in frags:
+            parts = split_font_styles(frag.string)
+            if len(parts) == 1 and parts[0][1] is None:
+                ret.append(frag)  # nothing to style
+                continue
+            for part, style in parts:
+                new_frag = Fragment(part, frag.graphics_state.copy(), frag.k, frag.link)
+                if style:
+                    self.font_styles[style](new_frag)
+                ret.append(new_frag)
+
+        return ret
+
+    def get_string_width(self, s, normalized=False, markdown=False):
+        """
+        Same as `FPDF.get_string_width` but memoized for the current font.
+        """
+        key = (
+            self.font_family,
+            self.font_style,
+            self.font_size_pt,
+            self.font_stretching,
+            self.char_spacing,
+            s,
+            normalized,
+            markdown,
+        )
+        try:
+            return self._string_widths[key]
+        except KeyError:
+            ret = self._string_widths[key] = super().get_string_width(s, normalized, markdown)
+            return ret
 
     # These 2 properties are used to check the current font
     @property
@@ -132,23 +248,29 @@ class PDF(FPDF):
         if key_family == "montserrat":
             key = key_family + key_style
             if key not in self.fonts:
-                self.add_font(
-                    key_family,
-                    key_style,  # type: ignore
-                    get_montserrat_font(key_style),
-                )
+                # Reuse the font parsed by the previous documents
+                self.fonts[key] = load_font(self, key_family, key_style, get_montserrat_font(key_style))
 
         super().set_font(key_family, style, size)
         self._in_set_font = False
 
     def draw_header(self, title=""):
-        config = Config.objects.get()
+        config, logo_name, logo_info, iccp = get_header()
+
+        if logo_name not in self.image_cache.images:
+            # Add the already decoded logo to this document (the image data is shared, it is never modified)
+            info = type(logo_info)(logo_info)
+            info["i"] = len(self.image_cache.images) + 1
+            info["usages"] = 0
+            if iccp:
+                info["iccp_i"] = self.image_cache.icc_profiles.setdefault(iccp, len(self.image_cache.icc_profiles))
+            self.image_cache.images[logo_name] = info
 
         logo_width = self.epw - self.get_string_width(config.official_name) - 10
         l_margin = self.l_margin
         y = self.y
 
-        info = self.image(config.logo, w=logo_width)
+        info = self.image(logo_name, w=logo_width)
         height = info.rendered_height
 
         end_y = self.y
@@ -171,6 +293,58 @@ class PDF(FPDF):
         self.x = l_margin
         self.y = end_y
 
+    def get_longest_hour_string_width(self):
+        return max(self.get_string_width(digit) for digit in "0123456789") * 4 + self.get_string_width("h - h ")
+
+    def draw_days(
+        self,
+        start: dt.date,
+        end: dt.date,
+        dates: dict[dt.date, list[Date]],
+        feasts: dict[dt.date, list[Date]],
+        details=False,
+    ):
+        """
+        Draw the days between `start` and `end` (included), with their feasts and dates.
+
+        If `details` is True, the cancelled dates are marked and the notes are added.
+        """
+        line_height = self.font_size * 1.25
+        hour_width = self.get_longest_hour_string_width()
+
+        day = start
+        while day <= end:
+            with self.use_font_face(FontFace(emphasis="BU")):
+                self.write(line_height, striptags(format_date_or_time(day)).capitalize())
+            with self.use_font_face(FontFace(size_pt=0.85 * self.font_size_pt)):
+                old_l_margin = self.l_margin
+                x = None
+                for feast in feasts.get(day, ()):
+                    self.write(line_height, " - ")
+                    if x is None:
+                        x = self.x
+                        self.l_margin = x
+                    self.write(line_height, striptags(feast.title))
+                self.l_margin = old_l_margin
+            self.ln()
+            for date in dates.get(day, ()):
+                title = striptags(date.title)
+                if details and date.cancelled:
+                    title += " (annulé)"
+                self.cell(hour_width, line_height, format_date_or_time(date.start_time, date.end_time, natural_time=True))
+                self.cell(0, line_height, title)
+                self.ln()
+                if details and date.note:
+                    with self.use_font_face(FontFace(emphasis="I", size_pt=0.85 * self.font_size_pt)):
+                        old_l_margin = self.l_margin
+                        self.l_margin += hour_width
+                        self.x = self.l_margin
+                        self.multi_cell(0, line_height, striptags(date.note).strip(), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+                        self.l_margin = old_l_margin
+                        self.x = old_l_margin
+            self.ln()
+            day += dt.timedelta(days=1)
+
     def start_columns(self, ncols: int, gutter: float | None = None):
         if gutter is None:
             gutter = (self.l_margin + self.r_margin) / 2
@@ -213,11 +387,126 @@ class PDF(FPDF):
         self.l_margin = self._old_l_margin
         self.r_margin = self._old_r_margin
 
+    @classmethod
+    def load_arguments(cls, *args, **kwargs) -> tuple[tuple, dict]:
+        """
+        Return the arguments of `get_versioned_key` and `render` for the arguments of the view,
+        so that the data needed by both of them is only loaded once per request.
+        """
+        return args, kwargs
+
+    @classmethod
+    def get_cache_key(cls, *args, **kwargs) -> str | None:
+        """
+        Return the key of the rendered document in the cache (the data version is added to it),
+        or None if the document must not be cached.
+        """
+        return None
+
+    @classmethod
+    def get_relative_since(cls, *args, **kwargs) -> dt.date | None:
+        """
+        Return the day since which the arguments give this document when they are relative
+        to the current date (e.g. the current week), or None if they give an absolute date.
+        """
+        return None
+
+    @classmethod
+    def get_versioned_key(cls, *args, **kwargs) -> tuple[str, int | None] | None:
+        """
+        Return the cache key combined with the current data version (None if the document must not be cached)
+        and the timestamp of the last modification.
+        """
+        key = cls.get_cache_key(*args, **kwargs)
+        if key is None:
+            return None
+        version, last_modified = get_data_version()
+        key = hashlib.sha1(f"{key}:{version}:{FPDF_VERSION}".encode()).hexdigest()
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        since = cls.get_relative_since(*args, **kwargs)
+        if since is not None:
+            # The same URL gives another document when the period changes, without any modification of the data
+            last_modified = max(last_modified or 0, int(date_to_datetime(since).timestamp()))
+        return key, last_modified
+
+    @staticmethod
+    def get_prerendered_path(key: str) -> Path:
+        """Return the path of a document pre-rendered by the `prerender_bulletins` command."""
+        return Path(settings.MEDIA_ROOT) / PRERENDERED_DIR / f"{key}.pdf"
+
     @classmethod
     def as_view(cls, *args, **kwargs):
         def view(request, *args, **kwargs):
+            if request.method == "POST":
+                # Each job is a render on the server, only the editors can ask for them
+                if not request.user.has_perm("dates.add_pdfjob"):
+                    return JsonResponse({"error": "Permission denied"}, status=403)
+                return cls._enqueue(kwargs)
+
+            args, kwargs = cls.load_arguments(*args, **kwargs)
+            versioned_key = cls.get_versioned_key(*args, **kwargs)
+            if versioned_key is None:
+                pdf = cls()
+                pdf.render(*args, **kwargs)
+                return HttpResponse(bytes(pdf.output()), content_type="application/pdf")
+
+            key, last_modified = versioned_key
+            etag = f'"{key}"'
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = cls._get_prerendered_response(key)
+            if response is None:
+                response = HttpResponse(cls._get_cached_document(key, *args, **kwargs), content_type="application/pdf")
+
+            response["ETag"] = etag
+            if last_modified:
+                response["Last-Modified"] = http_date(last_modified)
+            # Always revalidate, the data can change at any time
+            patch_cache_control(response, no_cache=True)
+            return response
+
+        return view
+
+    @classmethod
+    def get_document(cls, *args, **kwargs) -> bytes:
+        """Return the rendered document, taken from the pre-rendered files or the cache if possible."""
+        args, kwargs = cls.load_arguments(*args, **kwargs)
+        versioned_key = cls.get_versioned_key(*args, **kwargs)
+        if versioned_key is None:
             pdf = cls()
             pdf.render(*args, **kwargs)
-            return HttpResponse(bytes(pdf.output()), content_type="application/pdf")
+            return bytes(pdf.output())
 
-        return view
+        key, _last_modified = versioned_key
+        try:
+            return cls.get_prerendered_path(key).read_bytes()
+        except FileNotFoundError:
+            return cls._get_cached_document(key, *args, **kwargs)
+
+    @classmethod
+    def _get_cached_document(cls, key: str, *args, **kwargs) -> bytes:
+        data = cache.get(f"pdf:{key}")
+        if data is None:
+            pdf = cls()
+            pdf.render(*args, **kwargs)
+            data = bytes(pdf.output())
+            cache.set(f"pdf:{key}", data, getattr(settings, "PDF_CACHE_TIMEOUT", 7 * 24 * 3600))
+        return data
+
+    @classmethod
+    def _get_prerendered_response(cls, key: str) -> HttpResponse | None:
+        if not cls.get_prerendered_path(key).exists():
+            return None
+        return serve_media_file(f"{PRERENDERED_DIR}/{key}.pdf")
+
+    @classmethod
+    def _enqueue(cls, kwargs) -> HttpResponse:
+        """Add a render of the document to the queue of `dates.jobs` and return the URL of the job."""
+        if cls.document_name is None:
+            return HttpResponseNotAllowed(["GET"])
+        job = enqueue(cls.document_name, kwargs)
+        url = reverse("pdf-job", args=[job.pk])
+        response = JsonResponse({"id": job.pk, "status": job.status, "url": url}, status=202)
+        response["Location"] = url
+        return response
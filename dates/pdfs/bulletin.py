@@ -0,0 +1,108 @@
+import datetime as dt
+from collections import defaultdict
+
+from django.shortcuts import get_object_or_404
+from django.utils.timezone import localdate
+from fpdf.enums import Align, XPos, YPos
+from fpdf.fonts import FontFace
+
+from . import PDF
+from ..models import Bulletin, Date
+from ..occurrences import iter_occurrences
+from ..utils import MASS_RE, format_date_or_time, striptags
+
+class BulletinPDF(PDF):
+    """Renders a `Bulletin` published on a given day (today by default)."""
+
+    document_name = "bulletin"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+
+    @staticmethod
+    def get_day(date="") -> dt.date:
+        try:
+            return dt.date.fromisoformat(date)
+        except ValueError:
+            return localdate()
+
+    @classmethod
+    def get_window(cls, bulletin: Bulletin, date="") -> tuple[dt.date, dt.date]:
+        """Return the first and the last days of the bulletin."""
+        day = cls.get_day(date)
+        return day - dt.timedelta(days=bulletin.days_before), day + dt.timedelta(days=bulletin.days_after)
+
+    @classmethod
+    def get_cache_key(cls, pk, date=""):
+        # The window depends on the bulletin, which is versioned
+        return f"bulletin:{pk}:{cls.get_day(date)}"
+
+    @classmethod
+    def get_relative_since(cls, pk, date=""):
+        try:
+            dt.date.fromisoformat(date)
+        except ValueError:
+            # Published today
+            return localdate()
+        return None
+
+    def render(self, pk, date=""):
+        bulletin = get_object_or_404(Bulletin, pk=pk)
+        start, end = self.get_window(bulletin, date)
+        self.set_title(bulletin.title)
+
+        # All the dates of the window in one query (the ignored ones are needed to hide their occurrences),
+        # merged with the occurrences of the recurrences and the feasts
+        dates: dict[dt.date, list[Date]] = defaultdict(list)
+        feasts: dict[dt.date, list[Date]] = defaultdict(list)
+        queryset = Date._base_manager.select_related("celebrant")
+        for occurrence in iter_occurrences(start, end, True, queryset=queryset):
+            if occurrence.is_feast:
+                feasts[occurrence.start_date].append(occurrence)
+            elif not occurrence.ignored:
+                dates[occurrence.start_date].append(occurrence)
+
+        self.add_page()
+        self.draw_header(
+            format_date_or_time(start, end, weekday=False, year=True, natural=True).replace("1<sup>er</sup>", "1er")
+        )
+        with self.use_font_face(FontFace(emphasis="B", size_pt=1.5 * self.font_size_pt)):
+            self.cell(0, self.font_size * 2, bulletin.title, align=Align.C, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+        if bulletin.type == Bulletin.BulletinType.MASSES:
+            self.draw_masses(start, end, dates, feasts)
+        else:
+            self.start_columns(ncols=2)
+            self.draw_days(start, end, dates, feasts, details=True)
+            self.end_columns()
+
+    def draw_masses(
+        self,
+        start: dt.date,
+        end: dt.date,
+        dates: dict[dt.date, list[Date]],
+        feasts: dict[dt.date, list[Date]],
+    ):
+        """Draw a table of the masses and celebrations, with their celebrants."""
+        with self.table(col_widths=(4, 2, 7, 3), first_row_as_headings=True) as table:
+            table.row(("Jour", "Heure", "Célébration", "Célébrant"))
+            day = start
+            while day <= end:
+                masses = [date for date in dates.get(day, ()) if MASS_RE.match(date.title)]
+                label = striptags(format_date_or_time(day)).capitalize()
+                if feasts.get(day):
+                    label += "\n" + "\n".join(striptags(feast.title) for feast in feasts[day])
+                if not masses:
+                    # Keep the day and its feasts
+                    table.row((label, "", "", ""))
+                for i, mass in enumerate(masses):
+                    title = striptags(mass.title)
+                    if mass.cancelled:
+                        title += " (annulé)"
+                    table.row((
+                        label if i == 0 else "",
+                        format_date_or_time(mass.start_time, natural_time=True) if mass.start_time else "",
+                        title,
+                        mass.celebrant.name if mass.celebrant else "—",
+                    ))
+                day += dt.timedelta(days=1)
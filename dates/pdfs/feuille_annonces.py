@@ -1,40 +1,50 @@
 import datetime as dt
-from itertools import chain
-
-from fpdf.fonts import FontFace
+from collections import defaultdict
 
 from . import PDF
-from ..models import Date, FixedFeast, MovableFeast, Week
-from ..utils import format_date_or_time, striptags
+from ..models import Date, Week
+from ..occurrences import iter_occurrences
+from ..utils import format_date_or_time
 
 
 class FeuilleAnnonces(PDF):
+    document_name = "feuille-annonces"
+
     def __init__(self, *args, **kwargs):
         super().__init__("L")
 
-    def get_longest_hour_string_width(self):
-        return max(self.get_string_width(digit) for digit in "0123456789") * 4 + self.get_string_width("h - h ")
+    @staticmethod
+    def get_week(week: str | int = "") -> Week:
+        """Return the week to render (a date or an offset from the current week)."""
+        try:
+            offset = int(week)
+        except ValueError:
+            return Week(week, True)
+        return Week.get_current() + dt.timedelta(weeks=offset)
 
-    def render(self, week=""):
-        self.add_page()
+    @classmethod
+    def get_cache_key(cls, week=""):
+        return f"feuille-annonces:{cls.get_week(week)}"
 
+    @classmethod
+    def get_relative_since(cls, week=""):
         try:
-            offset = int(week)
+            dt.datetime.strptime(str(week), "%Y-%m-%d")
         except ValueError:
-            week = Week(week, True)
-        else:
-            week = Week.get_current()
-            week += dt.timedelta(weeks=offset)
+            # An offset from the current week
+            return Week.get_current().start
+        return None
+
+    def render(self, week=""):
+        self.add_page()
 
-        dates = Date.objects.get_for_week(week)
-        fixed_feasts = FixedFeast.objects.all()
-        movable_feasts = MovableFeast.objects.all()
+        week = self.get_week(week)
 
-        feasts: list[Date] = list(
-            chain.from_iterable(
-                feast.get_occurrences(week) for feast in chain(fixed_feasts, movable_feasts)
-            )
-        )
+        # Group the feasts and dates by day once
+        dates: dict[dt.date, list[Date]] = defaultdict(list)
+        feasts: dict[dt.date, list[Date]] = defaultdict(list)
+        for occurrence in iter_occurrences(week, queryset=Date.objects.all(), recurrences=False):
+            (feasts if occurrence.is_feast else dates)[occurrence.start_date].append(occurrence)
 
         self.start_columns(ncols=2)
 
@@ -43,28 +53,4 @@ class FeuilleAnnonces(PDF):
             .replace("1<sup>er</sup>", "1er")
         )
 
-        line_height = self.font_size * 1.25
-
-        day = week.start
-        while day in week:
-            with self.use_font_face(FontFace(emphasis="BU")):
-                self.write(line_height, striptags(format_date_or_time(day)).capitalize())
-            with self.use_font_face(FontFace(size_pt=0.85 * self.font_size_pt)):
-                old_l_margin = self.l_margin
-                x = None
-                for feast in feasts:
-                    if feast.start_date == day:
-                        self.write(line_height, " - ")
-                        if x is None:
-                            x = self.x
-                            self.l_margin = x
-                        self.write(line_height, striptags(feast.title))
-                self.l_margin = old_l_margin
-            self.ln()
-            for date in dates:
-                if date.start_date == day:
-                    self.cell(self.get_longest_hour_string_width(), line_height, format_date_or_time(date.start_time, date.end_time, natural_time=True))
-                    self.cell(0, line_height, striptags(date.title))
-                    self.ln()
-            self.ln()
-            day += dt.timedelta(days=1)
+        self.draw_days(week.start, week.end, dates, feasts)
@@ -1,24 +1,73 @@
-import tempfile
+import copy
+import threading
+from io import BytesIO
 from pathlib import Path
 from urllib.request import urlopen
 
-_fonts_paths: dict[str, str] = {}
-
-def get_montserrat_font(style: str):
-    if style in _fonts_paths and _fonts_paths[style].exists():
-        return _fonts_paths[style]
-    styles = {
-        "": "Regular",
-        "B": "Bold",
-        "I": "Italic",
-        "BI": "BoldItalic",
-    }
-    real_style = styles.get(str(style).upper(), "Regular")
-    BASE_URL = "https://raw.githubusercontent.com/JulietaUla/Montserrat/master/fonts/ttf"
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.fonts import SubsetMap, TTFFont
+
+# The fonts are downloaded once (at build time, see the `download_fonts` command) in the static files
+FONTS_DIR = Path(__file__).resolve().parent.parent / "static" / "dates" / "fonts"
+BASE_URL = "https://raw.githubusercontent.com/JulietaUla/Montserrat/master/fonts/ttf"
+STYLES = {
+    "": "Regular",
+    "B": "Bold",
+    "I": "Italic",
+    "BI": "BoldItalic",
+}
+
+
+def download_montserrat_font(style: str, force=False) -> Path:
+    """Download a Montserrat font file in the fonts directory (if it isn't already there)."""
+    real_style = STYLES.get(str(style).upper(), "Regular")
+    file = FONTS_DIR / f"Montserrat-{real_style}.ttf"
+    if file.exists() and not force:
+        return file
     with urlopen(f"{BASE_URL}/Montserrat-{real_style}.ttf") as f:
         data = f.read()
-    with tempfile.NamedTemporaryFile(suffix=".ttf", delete=False) as f:
-        f.write(data)
-        file = Path(f.name)
-        _fonts_paths[style] = file
-        return file
+    FONTS_DIR.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so that a partial download is never used
+    tmp = file.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(file)
+    return file
+
+
+def get_montserrat_font(style: str) -> Path:
+    return download_montserrat_font(style)
+
+
+_parsed_fonts: dict[tuple[Path, str], tuple[TTFFont, bytes]] = {}
+_parsed_fonts_lock = threading.Lock()
+
+
+def load_font(pdf: FPDF, family: str, style: str, path: Path) -> TTFFont:
+    """
+    Return a font for `pdf`, like `FPDF.add_font` would create it.
+
+    The font file is only read and parsed once per process, by `add_font` on a document of its own:
+    the metrics are shared between all the documents, only the state that depends on the document is new.
+    """
+    fontkey = family.lower() + style
+    with _parsed_fonts_lock:
+        try:
+            parsed, data = _parsed_fonts[path, style]
+        except KeyError:
+            template = FPDF()
+            template.add_font(family, style, path)
+            parsed = template.fonts[fontkey]
+            data = Path(path).read_bytes()
+            _parsed_fonts[path, style] = parsed, data
+
+    # Shallow copy: every attribute of the parsed font is kept, even the ones added by later versions of fpdf2
+    font = copy.copy(parsed)
+    # The document state
+    font.i = len(pdf.fonts) + 1
+    font.fontkey = fontkey
+    font.missing_glyphs = []
+    # The font file is subsetted in place when the document is output, so each document needs its own copy
+    font.ttfont = ttLib.TTFont(BytesIO(data), recalcTimestamp=False, fontNumber=0, lazy=True)
+    font.subset = SubsetMap(font)
+    return font
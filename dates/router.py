@@ -1,10 +1,13 @@
 import datetime as dt
-import re
 
 from rest_framework import permissions, serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
 from .models import Celebrant, Date, Recurrence, Week
+from .occurrences import iter_occurrences
+from .utils import MASS_RE
 
 class CelebrantSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,7 +29,7 @@ class PublicDateSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
 
-        if re.match(r"^(Messe|Célébration|Confession)s?\b", representation["title"]):
+        if MASS_RE.match(representation["title"]):
             representation["celebrant"] = instance.celebrant.name if instance.celebrant else None
 
         return representation
@@ -84,17 +87,7 @@ class DateViewSet(viewsets.ModelViewSet):
         # 2. Appel à votre manager personnalisé qui gère HasOccurrences
         # La fonction get_occurrences renvoie un mélange d'objets en DB
         # et d'objets Date instanciés à la volée pour les récurrences.
-        events = Recurrence.objects.all()
-        result_list = [*self.get_queryset()]
-        occurrences = [*result_list]
-        for event in events:
-            for occurrence in event.get_occurrences(start, end):
-                if any(
-                    item.event == occurrence.event and item.start_date == occurrence.start_date
-                    for item in result_list
-                ):
-                    continue
-                occurrences.append(occurrence)
+        occurrences = [*iter_occurrences(start, end, queryset=self.get_queryset(), feasts=False)]
 
         # 3. Sérialisation de la liste d'objets (réels + virtuels)
         serializer_class = self.get_serializer_class()
@@ -107,6 +100,31 @@ class RecurrenceViewSet(viewsets.ModelViewSet):
     queryset = Recurrence.objects.all()
     serializer_class = RecurrenceSerializer
 
+    @action(detail=True)
+    def occurrences(self, request, pk=None):
+        """Occurrences de la récurrence, par pages (le curseur renvoyé permet d'obtenir la suite)."""
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            raise ValidationError("Invalid limit")
+        limit = max(1, min(limit, 100))
+        try:
+            start = dt.date.fromisoformat(request.query_params.get("start") or str(Week.get_current()))
+            end = request.query_params.get("end")
+            end = dt.date.fromisoformat(end) if end else None
+            occurrences = self.get_object().get_occurrences(
+                start, end, limit=limit, cursor=request.query_params.get("cursor")
+            )
+        except ValueError as err:
+            raise ValidationError(str(err))
+
+        serializer = DateSerializer(occurrences, many=True, context={"request": request})
+        return Response({
+            "results": serializer.data,
+            "ended": occurrences.ended,
+            "cursor": occurrences.cursor,
+        })
+
 def register(router):
     router.register("celebrants", CelebrantViewSet)
     router.register("dates", DateViewSet)
@@ -83,7 +83,8 @@ document.addEventListener("DOMContentLoaded", async function() {
         if(updating) return;
         updating = true;
         try {
-            var response = await fetch("../../get_occurrences", {
+            var objectId = location.pathname.match(/\/([^\/]+)\/change\/$/);
+            var response = await fetch("../../get_occurrences" + (objectId ? "?object_id=" + objectId[1] : ""), {
                 method: "POST",
                 body: new FormData(form),
             });
@@ -1,3 +1,720 @@
-from django.test import TestCase
+import datetime as dt
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.utils.timezone import now
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont
+from fpdf import FPDF
+from fpdf.enums import CharVPos
+from icalendar import Calendar as ICalendar
+from PIL import Image
+from pypdf import PdfReader
+
+from .liturgical_calendar import _get_advent_start, get_liturgical_year, get_movable_feasts_for
+from .caldav import DAV, format_sync_token
+from .ical import iter_export_occurrences
+from .ical_import import Importer, iter_events
+from .models import Bulletin, Celebrant, Config, Date, FixedFeast, OccurrencesList, Recurrence, VirtualOccurrence, Week
+from .occurrences import get_horizon, iter_fixed_feast_occurrences, iter_occurrences
+from .pdfs import PDF, get_header, invalidate_header, split_font_styles
+from .pdfs.bulletin import BulletinPDF
+from .pdfs.feuille_annonces import FeuilleAnnonces
+from .pdfs.fonts import STYLES
+from .utils import MASS_RE, get_yearly_month_day
+from .versions import bump_version
+
+def build_test_font(path: Path, style: str):
+    """Write a small TrueType font (a box for every Latin character) to test the PDFs without the real fonts."""
+    chars = [*range(0x20, 0x250), *range(0x2010, 0x2030), 0x20AC]
+    glyph_order = [".notdef"] + [f"uni{char:04X}" for char in chars]
+    glyphs = {}
+    for name in glyph_order:
+        pen = TTGlyphPen(None)
+        if name != "uni0020":
+            pen.moveTo((50, 0))
+            pen.lineTo((50, 700))
+            pen.lineTo((450, 700))
+            pen.lineTo((450, 0))
+            pen.closePath()
+        glyphs[name] = pen.glyph()
+
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyph_order)
+    builder.setupCharacterMap({char: f"uni{char:04X}" for char in chars})
+    builder.setupGlyf(glyphs)
+    builder.setupHorizontalMetrics({name: (500, 50) for name in glyph_order})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({"familyName": "Montserrat", "styleName": style})
+    builder.setupOS2(sTypoAscender=800, sTypoDescender=-200, usWinAscent=800, usWinDescent=200)
+    builder.setupPost()
+    builder.save(path)
+
+
+class TestFontsMixin:
+    """Replace the Montserrat fonts with test fonts, so that the PDFs are rendered without downloading them."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = Path(tempfile.mkdtemp())
+        cls.addClassCleanup(shutil.rmtree, directory)
+        fonts = {}
+        for style, name in STYLES.items():
+            fonts[style] = directory / f"Montserrat-{name}.ttf"
+            build_test_font(fonts[style], name)
+        patcher = mock.patch("dates.pdfs.get_montserrat_font", lambda style: fonts.get(str(style).upper(), fonts[""]))
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+
+class PDFTestMixin(TestFontsMixin):
+    """Render the PDFs with the test fonts, and a configuration with a logo in a temporary MEDIA_ROOT."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+
+    def setUp(self):
+        super().setUp()
+        # The rendered documents and the header are kept under data versions that start again in each test
+        cache.clear()
+        invalidate_header()
+        self.config = self.create_config()
+
+    @staticmethod
+    def create_config() -> Config:
+        logo = BytesIO()
+        Image.new("RGB", (20, 10), "blue").save(logo, "PNG")
+        return Config.objects.create(official_name="Paroisse de test", logo=SimpleUploadedFile("logo.png", logo.getvalue()))
+
+
+def read(response) -> bytes:
+    return b"".join(response.streaming_content) if response.streaming else response.content
+
+
+MONDAYS = "DTSTART:20260105T000000\nRRULE:FREQ=WEEKLY;BYDAY=MO;UNTIL=20260302T000000"
+
+
+class LiturgicalCalendarTests(SimpleTestCase):
+    def test_advent_start(self):
+        for year in range(1900, 2101):
+            # The 4th Sunday before Christmas, found day by day
+            sunday = dt.date(year, 12, 24)
+            while sunday.weekday() != 6:
+                sunday -= dt.timedelta(days=1)
+            with self.subTest(year=year):
+                self.assertEqual(_get_advent_start(year), sunday - dt.timedelta(weeks=3))
+
+    def test_liturgical_year(self):
+        self.assertEqual(get_liturgical_year(dt.date(2025, 11, 29)), 2024)
+        self.assertEqual(get_liturgical_year(dt.date(2025, 11, 30)), 2025)
+        self.assertEqual(get_liturgical_year(dt.datetime(2026, 6, 1, 12)), 2025)
+
+    def test_movable_feasts(self):
+        feasts = get_movable_feasts_for(2025)
+        self.assertEqual(feasts[dt.date(2025, 11, 30)], ("advent_sunday", {"n": 1}))
+        self.assertEqual(feasts[dt.date(2026, 1, 4)], ("epiphany", {}))
+        self.assertEqual(feasts[dt.date(2026, 1, 11)], ("lord_baptism", {}))
+        self.assertEqual(feasts[dt.date(2026, 2, 18)], ("ash_wednesday", {}))
+        self.assertEqual(feasts[dt.date(2026, 4, 5)], ("easter", {}))
+        self.assertEqual(feasts[dt.date(2026, 5, 24)], ("pentecost", {}))
+        # Christ King, the last Sunday before the next Advent
+        self.assertEqual(feasts[dt.date(2026, 11, 22)], ("ordinary_time_sunday", {"n": 34}))
+        self.assertEqual(max(feasts), dt.date(2026, 11, 22))
+
+
+class OccurrencesTests(TestCase):
+    def setUp(self):
+        self.recurrence = Recurrence.objects.create(title="Messe", start_time=dt.time(18), recurrence=MONDAYS)
+
+    def test_cursor_round_trip(self):
+        expected = self.recurrence.get_occurrences(dt.date(2026, 1, 1), dt.date(2026, 3, 31), limit=100)
+        self.assertEqual(len(expected), 9)
+        self.assertTrue(expected.ended)
+
+        pages = [self.recurrence.get_occurrences(dt.date(2026, 1, 1), dt.date(2026, 3, 31), limit=4)]
+        while not pages[-1].ended:
+            pages.append(self.recurrence.get_occurrences(cursor=pages[-1].cursor, limit=4))
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        self.assertIsNone(pages[-1].cursor)
+        self.assertEqual(
+            [occurrence.start_date for page in pages for occurrence in page],
+            [occurrence.start_date for occurrence in expected],
+        )
+
+    def test_cursor_several_occurrences_a_day(self):
+        recurrence = Recurrence.objects.create(
+            title="Adoration",
+            recurrence="DTSTART:20260102T000000\nRRULE:FREQ=WEEKLY;BYDAY=FR;BYHOUR=9,15;COUNT=4",
+        )
+        pages = [recurrence.get_occurrences(dt.date(2026, 1, 1), limit=1)]
+        while not pages[-1].ended:
+            pages.append(recurrence.get_occurrences(cursor=pages[-1].cursor, limit=1))
+        self.assertEqual(
+            [(occurrence.start_date, occurrence.start_time) for page in pages for occurrence in page],
+            [
+                (dt.date(2026, 1, 2), dt.time(9)),
+                (dt.date(2026, 1, 2), dt.time(15)),
+                (dt.date(2026, 1, 9), dt.time(9)),
+                (dt.date(2026, 1, 9), dt.time(15)),
+            ],
+        )
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            OccurrencesList.parse_cursor("invalid")
+        with self.assertRaises(ValueError):
+            self.recurrence.get_occurrences(cursor="invalid")
+
+    def test_limit(self):
+        client = Client(HTTP_HOST="localhost")
+        client.force_login(User.objects.create_superuser("admin"))
+        url = f"/api/recurrences/{self.recurrence.pk}/occurrences/?start=2026-01-01&end=2026-12-31"
+
+        for limit, count in (("0", 1), ("-5", 1), ("3", 3), ("1000", 9)):
+            with self.subTest(limit=limit):
+                response = client.get(f"{url}&limit={limit}")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()["results"]), count)
+        self.assertEqual(client.get(f"{url}&limit=x").status_code, 400)
+        self.assertEqual(client.get(f"{url}&cursor=invalid").status_code, 400)
+
+    def test_merge(self):
+        Date.objects.create(event=self.recurrence, start_date=dt.date(2026, 1, 12), _start_time=dt.time(9))
+        Date.objects.create(_title="Concert", start_date=dt.date(2026, 1, 14), _start_time=dt.time(20, 30))
+        occurrences = iter_occurrences(dt.date(2026, 1, 5), dt.date(2026, 1, 19), True, queryset=Date.objects.all(), feasts=False)
+        self.assertEqual(
+            [(occurrence.title, occurrence.start_date, occurrence.start_time) for occurrence in occurrences],
+            [
+                ("Messe", dt.date(2026, 1, 5), dt.time(18)),
+                ("Messe", dt.date(2026, 1, 12), dt.time(9)),
+                ("Concert", dt.date(2026, 1, 14), dt.time(20, 30)),
+                ("Messe", dt.date(2026, 1, 19), dt.time(18)),
+            ],
+        )
+
+    def test_several_occurrences_a_day(self):
+        week = Week.get_current()
+        recurrence = Recurrence.objects.create(
+            title="Adoration",
+            recurrence=f"DTSTART:{week.start:%Y%m%d}T000000\nRRULE:FREQ=WEEKLY;BYDAY=FR;BYHOUR=9,15;COUNT=4",
+        )
+        friday = week.start + dt.timedelta(days=4)
+        expected = [
+            (friday, dt.time(9)),
+            (friday, dt.time(15)),
+            (friday + dt.timedelta(weeks=1), dt.time(9)),
+            (friday + dt.timedelta(weeks=1), dt.time(15)),
+        ]
+        self.assertEqual(
+            list(VirtualOccurrence.objects.filter(recurrence=recurrence).order_by("start_date", "start_time")
+                 .values_list("start_date", "start_time")),
+            expected,
+        )
+        # The stored occurrences and the rule give the same times
+        occurrences = iter_occurrences(week.start, week.end + dt.timedelta(weeks=1), feasts=False)
+        self.assertEqual([(occurrence.start_date, occurrence.start_time) for occurrence in occurrences], expected)
+        occurrences = recurrence.get_occurrences(week.start, limit=10)
+        self.assertEqual([(occurrence.start_date, occurrence.start_time) for occurrence in occurrences], expected)
+
+    def test_anchor(self):
+        # Like the rules of the admin widget, without DTSTART
+        recurrence = Recurrence.objects.create(title="Messe", recurrence="RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO")
+        self.assertEqual(recurrence.anchor, get_horizon()[0])
+        week = Week.get_current()
+
+        def assert_same_phase(days):
+            days = list(days)
+            self.assertTrue(days)
+            for day in days:
+                self.assertEqual((day - recurrence.anchor).days % 14, 0, day)
+
+        # Stored occurrences
+        assert_same_phase(VirtualOccurrence.objects.filter(recurrence=recurrence).values_list("start_date", flat=True))
+        # Rule evaluated from other starts, inside and after the stored range
+        for start in (week.start + dt.timedelta(weeks=1), get_horizon()[1] + dt.timedelta(weeks=1)):
+            assert_same_phase(occurrence.start_date for occurrence in recurrence.get_occurrences(start, limit=5))
+            assert_same_phase(
+                occurrence.start_date
+                for occurrence in iter_occurrences(start, start + dt.timedelta(weeks=6), feasts=False)
+            )
+
+        client = Client(HTTP_HOST="localhost")
+        client.force_login(User.objects.create_superuser("admin"))
+        response = client.get(
+            f"/api/recurrences/{recurrence.pk}/occurrences/",
+            {"start": str(week.start + dt.timedelta(weeks=1))},
+        )
+        assert_same_phase(dt.date.fromisoformat(date["start_date"]) for date in response.json()["results"])
+
+        # Saving it again (e.g. in another week) keeps its anchor
+        anchor = recurrence.anchor
+        recurrence.title = "Messe des familles"
+        recurrence.save()
+        recurrence.refresh_from_db()
+        self.assertEqual(recurrence.anchor, anchor)
+
+
+class FixedFeastTests(TestCase):
+    def test_yearly_month_day(self):
+        for text, expected in (
+            ("RRULE:FREQ=YEARLY;BYMONTH=8;BYMONTHDAY=15", (8, 15, None)),
+            ("DTSTART:20200106T000000\nRRULE:FREQ=YEARLY", (1, 6, dt.date(2020, 1, 6))),
+            ("DTSTART:20200106T000000\nRRULE:FREQ=YEARLY;BYMONTH=3", (3, 6, dt.date(2020, 1, 6))),
+            ("RRULE:FREQ=YEARLY;BYMONTH=1", None),
+            ("RRULE:FREQ=YEARLY;INTERVAL=2;BYMONTH=1;BYMONTHDAY=6", None),
+            ("RRULE:FREQ=YEARLY;BYMONTH=1;BYMONTHDAY=-1", None),
+            ("RRULE:FREQ=YEARLY;BYMONTH=1,2;BYMONTHDAY=6", None),
+            ("RRULE:FREQ=YEARLY;BYMONTH=1;BYMONTHDAY=6;BYDAY=MO", None),
+            ("RRULE:FREQ=YEARLY;BYMONTH=1;BYMONTHDAY=6\nEXDATE:20260106T000000", None),
+            ("invalid", None),
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(get_yearly_month_day(text), expected)
+
+    def test_index(self):
+        FixedFeast.objects.create(name="Assomption", recurrence="RRULE:FREQ=YEARLY;BYMONTH=8;BYMONTHDAY=15")
+        FixedFeast.objects.create(name="Épiphanie", recurrence="DTSTART:20270106T000000\nRRULE:FREQ=YEARLY")
+        # Not indexed, its rule is evaluated
+        FixedFeast.objects.create(name="Premier lundi", recurrence="RRULE:FREQ=MONTHLY;BYDAY=+1MO")
+
+        occurrences = iter_fixed_feast_occurrences(dt.date(2026, 1, 1), dt.date(2026, 1, 31), True)
+        self.assertEqual([(o.title, o.start_date) for o in occurrences], [("Premier lundi", dt.date(2026, 1, 5))])
+        occurrences = iter_fixed_feast_occurrences(dt.date(2027, 1, 5), dt.date(2027, 1, 7), True)
+        self.assertEqual([(o.title, o.start_date) for o in occurrences], [("Épiphanie", dt.date(2027, 1, 6))])
+        occurrences = iter_fixed_feast_occurrences(dt.date(2026, 8, 15), dt.date(2026, 8, 15), True)
+        self.assertEqual([o.title for o in occurrences], ["Assomption"])
+
+
+class ICalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client(HTTP_HOST="localhost", HTTP_USER_AGENT="tests")
+
+    def export(self, **params) -> str:
+        response = self.client.get("/export", {"start": "2026-01-01", "end": "2026-03-31", **params})
+        self.assertEqual(response.status_code, 200)
+        return read(response).decode()
+
+    def get_occurrences(self):
+        return [
+            (occurrence.title, occurrence.start_date, occurrence.start_time, occurrence.end_time, occurrence.cancelled)
+            for occurrence in iter_export_occurrences(dt.date(2026, 1, 1), dt.date(2026, 3, 31))
+        ]
+
+    def test_round_trip(self):
+        recurrence = Recurrence.objects.create(title="Messe", start_time=dt.time(18), end_time=dt.time(19), recurrence=MONDAYS)
+        Date.objects.create(event=recurrence, start_date=dt.date(2026, 1, 12), cancelled=True)
+        Date.objects.create(event=recurrence, start_date=dt.date(2026, 1, 19), ignored=True)
+        Date.objects.create(_title="Concert", start_date=dt.date(2026, 1, 14), _start_time=dt.time(20, 30))
+        expected = self.get_occurrences()
+        self.assertEqual(len(expected), 9)
+
+        text = self.export()
+        self.assertIn("RRULE:", text)
+        self.assertIn("EXDATE;TZID=Europe/Paris:20260119T180000", text)
+        self.assertIn("RECURRENCE-ID;TZID=Europe/Paris:20260112T180000", text)
+
+        Date._base_manager.all().delete()
+        Recurrence.objects.all().delete()
+        importer = Importer()
+        importer.import_events(iter_events(text.splitlines(keepends=True)))
+        importer.finish()
+        self.assertEqual(importer.stats["invalid"], 0)
+        self.assertEqual(self.get_occurrences(), expected)
+
+        # Importing the same calendar again doesn't create anything
+        importer = Importer()
+        importer.import_events(iter_events(text.splitlines(keepends=True)))
+        self.assertEqual(importer.stats["created"], 0)
+
+    def test_expand(self):
+        Recurrence.objects.create(title="Messe", start_time=dt.time(18), recurrence=MONDAYS)
+        text = self.export(expand="1")
+        self.assertNotIn("RRULE:", text)
+        self.assertEqual(text.count("BEGIN:VEVENT"), 9)
+
+    def test_rule_times(self):
+        recurrence = Recurrence.objects.create(
+            title="Adoration",
+            recurrence="DTSTART:20260102T000000\nRRULE:FREQ=WEEKLY;BYDAY=FR;BYHOUR=9,15;UNTIL=20260301T000000",
+        )
+        Date.objects.create(event=recurrence, start_date=dt.date(2026, 1, 9), _start_time=dt.time(15), _title="Adoration et confessions")
+        Date.objects.create(event=recurrence, start_date=dt.date(2026, 1, 16), ignored=True)
+
+        series, override = ICalendar.from_ical(self.export()).walk("VEVENT")
+        paris = ZoneInfo("Europe/Paris")
+        # The DTSTART is a DATE-TIME, like the occurrences of the rule
+        self.assertEqual(series.decoded("DTSTART"), dt.datetime(2026, 1, 2, 9, tzinfo=paris))
+        self.assertEqual(series["RRULE"]["BYHOUR"], [9, 15])
+        # The other occurrence of the day of the override is removed, like in `iter_occurrences`
+        self.assertEqual(override.decoded("RECURRENCE-ID"), dt.datetime(2026, 1, 9, 15, tzinfo=paris))
+        self.assertEqual(
+            sorted(value.dt for exdate in series["EXDATE"] for value in exdate.dts),
+            [
+                dt.datetime(2026, 1, 9, 9, tzinfo=paris),
+                dt.datetime(2026, 1, 16, 9, tzinfo=paris),
+                dt.datetime(2026, 1, 16, 15, tzinfo=paris),
+            ],
+        )
+
+    def test_round_trip_rule_times(self):
+        recurrence = Recurrence.objects.create(
+            title="Adoration",
+            recurrence="DTSTART:20260102T000000\nRRULE:FREQ=WEEKLY;BYDAY=FR;BYHOUR=9,15;BYMINUTE=30;UNTIL=20260227T100000",
+        )
+        Date.objects.create(event=recurrence, start_date=dt.date(2026, 1, 9), _start_time=dt.time(15, 30), _title="Adoration et confessions")
+        Date.objects.create(event=recurrence, start_date=dt.date(2026, 1, 16), ignored=True)
+        expected = self.get_occurrences()
+        self.assertEqual(len(expected), 14)
+        text = self.export()
+
+        Date._base_manager.all().delete()
+        Recurrence.objects.all().delete()
+        importer = Importer()
+        importer.import_events(iter_events(text.splitlines(keepends=True)))
+        importer.finish()
+        self.assertEqual(importer.stats["invalid"], 0)
+        # The times of the occurrences, of the EXDATEs and of the UNTIL are kept
+        self.assertEqual(self.get_occurrences(), expected)
+
+    def test_several_occurrences_a_day(self):
+        Recurrence.objects.create(
+            title="Adoration",
+            recurrence="DTSTART:20260102T000000\nRRULE:FREQ=WEEKLY;BYDAY=FR;BYHOUR=9,15;COUNT=2",
+        )
+        calendar = ICalendar.from_ical(self.export(expand="1"))
+        self.assertEqual(
+            sorted((str(event["UID"]), event.start.time()) for event in calendar.walk("VEVENT")),
+            [("1_20260102T090000", dt.time(9)), ("1_20260102T150000", dt.time(15))],
+        )
+
+    def test_title_filter(self):
+        Recurrence.objects.create(title="Messe", start_time=dt.time(18), recurrence=MONDAYS)
+        Date.objects.create(_title="Concert", start_date=dt.date(2026, 1, 14))
+        self.assertEqual(self.export(title="concert").count("BEGIN:VEVENT"), 1)
+        # The anonymous users can't use regexes
+        self.assertEqual(self.export(title="^(Messe|Concert)$").count("BEGIN:VEVENT"), 0)
+
+        self.client.force_login(User.objects.create_user("editor"))
+        self.assertEqual(self.export(title="^(Messe|Concert)$").count("BEGIN:VEVENT"), 10)
+        self.assertEqual(self.client.get("/export", {"title": "("}).status_code, 400)
+
+    def test_masses_filter(self):
+        Recurrence.objects.create(title="Messe", start_time=dt.time(18), recurrence=MONDAYS)
+        Date.objects.create(_title="Concert", start_date=dt.date(2026, 1, 14))
+        Date.objects.create(_title="Confessions", start_date=dt.date(2026, 1, 15))
+        Date.objects.create(_title="Messe annulée", start_date=dt.date(2026, 1, 16), cancelled=True)
+        # The anonymous users get the same feed as with the regex
+        text = self.export(masses="1")
+        self.assertEqual(text.count("BEGIN:VEVENT"), 11)
+        self.assertNotIn("Concert", text)
+        self.assertEqual(self.export(masses="1", cancelled="0").count("BEGIN:VEVENT"), 10)
+
+        self.client.force_login(User.objects.create_user("editor"))
+        self.assertEqual(self.export(title=MASS_RE.pattern), text)
+
+    def test_relative_last_modified(self):
+        Recurrence.objects.create(title="Messe", start_time=dt.time(18), recurrence=MONDAYS)
+        response = self.client.get("/export")
+        read(response)
+        last_modified = response["Last-Modified"]
+        self.assertEqual(self.client.get("/export", HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # The current week changes without any modification of the data
+        with mock.patch("dates.models.now", return_value=now() + dt.timedelta(weeks=1)):
+            response = self.client.get("/export", HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+            read(response)
+            response = self.client.get("/export", {"start": "2026-01-05"}, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+
+
+class CalDAVTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client(HTTP_HOST="localhost", HTTP_USER_AGENT="tests")
+
+    def sync(self, token: str = "") -> tuple[int, dict[str, str], str]:
+        """Return the status, the status of each changed resource and the new token of a sync-collection REPORT."""
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<D:sync-collection xmlns:D="DAV:"><D:sync-token>{token}</D:sync-token>'
+            "<D:sync-level>1</D:sync-level><D:prop><D:getetag/></D:prop></D:sync-collection>"
+        )
+        response = self.client.generic("REPORT", "/export", body, content_type="application/xml")
+        if response.status_code != 207:
+            return response.status_code, {}, ""
+        root = ElementTree.fromstring(read(response))
+        statuses = {}
+        for element in root.iter(f"{{{DAV}}}response"):
+            href = element.findtext(f"{{{DAV}}}href").rsplit("/", 1)[-1].removesuffix(".ics")
+            status = element.findtext(f"{{{DAV}}}status") or element.findtext(f".//{{{DAV}}}status")
+            statuses[href] = status.split()[1]
+        return response.status_code, statuses, root.findtext(f"{{{DAV}}}sync-token")
+
+    def test_sync_collection(self):
+        first = Recurrence.objects.create(title="Messe", start_time=dt.time(18), recurrence=MONDAYS)
+        second = Recurrence.objects.create(title="Vêpres", start_time=dt.time(17), recurrence=MONDAYS)
+        status, statuses, token = self.sync()
+        self.assertEqual(status, 207)
+        self.assertEqual(statuses, {f"recurrence-{first.pk}": "200", f"recurrence-{second.pk}": "200"})
+
+        # No change
+        status, statuses, token = self.sync(token)
+        self.assertEqual(statuses, {})
+
+        date = Date.objects.create(_title="Concert", start_date=dt.date(2026, 1, 14))
+        status, statuses, token = self.sync(token)
+        self.assertEqual(statuses, {f"date-{date.pk}": "200"})
+
+        # An override is part of the resource of its recurrence, it is not a separate resource
+        override = Date.objects.create(event=first, start_date=dt.date(2026, 1, 12), cancelled=True)
+        status, statuses, token = self.sync(token)
+        self.assertEqual(statuses, {f"recurrence-{first.pk}": "200", f"date-{override.pk}": "404"})
+
+        # Moving it to another recurrence changes both of them
+        override.event = second
+        override.save()
+        status, statuses, token = self.sync(token)
+        self.assertEqual(
+            statuses,
+            {f"recurrence-{first.pk}": "200", f"recurrence-{second.pk}": "200", f"date-{override.pk}": "404"},
+        )
+
+        name = f"date-{date.pk}"
+        date.delete()
+        status, statuses, token = self.sync(token)
+        self.assertEqual(statuses, {name: "404"})
+
+    def test_sync_import(self):
+        status, statuses, token = self.sync()
+        self.assertEqual(statuses, {})
+
+        lines = [
+            "BEGIN:VCALENDAR",
+            "BEGIN:VEVENT",
+            "UID:concert",
+            "SUMMARY:Concert",
+            "DTSTART;VALUE=DATE:20260114",
+            "END:VEVENT",
+            "END:VCALENDAR",
+        ]
+        Importer().import_events(iter_events(lines))
+        date = Date.objects.get(uid="concert")
+        status, statuses, token = self.sync(token)
+        self.assertEqual(statuses, {f"date-{date.pk}": "200"})
+
+    def test_anchor(self):
+        # Like the rules of the admin widget, without DTSTART
+        recurrence = Recurrence.objects.create(title="Messe", recurrence="RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO")
+        url = f"/export/recurrence-{recurrence.pk}.ics"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        series = ICalendar.from_ical(response.content).walk("VEVENT")[0]
+        self.assertEqual((series.decoded("DTSTART") - recurrence.anchor).days % 14, 0)
+
+        # A week later, the stored occurrences start later but the resource is the same, even when it is built again
+        later = now() + dt.timedelta(weeks=1)
+        with mock.patch("dates.models.now", return_value=later), mock.patch("dates.occurrences.localdate", return_value=later.date()):
+            call_command("refresh_occurrences", rebuild=True, verbosity=0)
+            cache.clear()
+            later = self.client.get(url)
+        self.assertEqual(later["ETag"], response["ETag"])
+        self.assertEqual(later.content, response.content)
+
+    def test_invalid_token(self):
+        self.assertEqual(self.sync("invalid")[0], 403)
+        self.assertEqual(self.sync(format_sync_token(10**9))[0], 403)
+
+
+class FontTests(TestFontsMixin, SimpleTestCase):
+    def render(self, text: str) -> PdfReader:
+        pdf = PDF()
+        pdf.add_page()
+        for style in STYLES:
+            pdf.set_font("Montserrat", style, 12)
+            pdf.cell(text=text, new_x="LMARGIN", new_y="NEXT")
+        return PdfReader(BytesIO(pdf.output()))
+
+    def test_render_loaded_fonts(self):
+        # The second document reuses the fonts parsed for the first one
+        for text in ("Épiphanie du Seigneur", "Messe – 10 €"):
+            reader = self.render(text)
+            self.assertEqual("".join(page.extract_text() for page in reader.pages).count(text), len(STYLES))
+            # Each document embeds the glyphs it uses, and only them
+            fonts = reader.pages[0]["/Resources"]["/Font"].values()
+            self.assertEqual(len(fonts), len(STYLES))
+            for font in fonts:
+                descriptor = font.get_object()["/DescendantFonts"][0].get_object()["/FontDescriptor"]
+                embedded = TTFont(BytesIO(descriptor["/FontFile2"].get_data()))
+                self.assertEqual(set(embedded.getBestCmap()), set(map(ord, text)))
+
+
+class FeuilleAnnoncesTests(PDFTestMixin, TestCase):
+    def test_render(self):
+        Date.objects.create(_title="Concert", start_date=dt.date(2026, 1, 7), _start_time=dt.time(20, 30))
+        Date.objects.create(_title="Chapelet", start_date=dt.date(2026, 1, 7), _start_time=dt.time(15))
+        Date.objects.create(_title="Hors de la semaine", start_date=dt.date(2026, 1, 12))
+        pdf = FeuilleAnnonces()
+        pdf.render("2026-01-05")
+        lines = "".join(page.extract_text() for page in PdfReader(BytesIO(pdf.output())).pages).splitlines()
+        self.assertEqual(lines[:3], ["Paroisse de test", "Sous nos clochers", "du 5 au 11 janvier 2026"])
+        self.assertEqual(
+            lines[3:],
+            [
+                "Lundi 5 janvier",
+                "Mardi 6 janvier",
+                "Mercredi 7 janvier",
+                "15h Chapelet",
+                "20h30 Concert",
+                "Jeudi 8 janvier",
+                "Vendredi 9 janvier",
+                "Samedi 10 janvier",
+                "Dimanche 11 janvier - Le Baptême du Seigneur",
+            ],
+        )
+
+    def test_string_widths(self):
+        pdf = PDF()
+        pdf.add_page()
+        pdf.set_font("Montserrat", "", 12)
+        self.assertEqual(pdf.get_string_width("Messe"), FPDF.get_string_width(pdf, "Messe"))
+        # The memoized widths depend on the current font
+        pdf.set_font("Montserrat", "", 24)
+        self.assertEqual(pdf.get_string_width("Messe"), FPDF.get_string_width(pdf, "Messe"))
+        self.assertEqual(len(pdf._string_widths), 2)
+
+    def test_relative_last_modified(self):
+        client = Client(HTTP_HOST="localhost")
+        response = client.get("/feuille-annonces")
+        self.assertEqual(response.status_code, 200)
+        last_modified = response["Last-Modified"]
+        self.assertEqual(client.get("/feuille-annonces", HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # The current week changes without any modification of the data
+        with mock.patch("dates.models.now", return_value=now() + dt.timedelta(weeks=1)):
+            for url in ("/feuille-annonces", "/feuille-annonces/1"):
+                with self.subTest(url=url):
+                    self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+            url = f"/feuille-annonces/{Week.get_current()}"
+            self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+
+class FontStylesTests(TestFontsMixin, SimpleTestCase):
+    def test_split(self):
+        self.assertEqual(
+            split_font_styles("Le 1er mai, https://example.com ou 04 92 43 00 00 (contact@example.com)."),
+            (
+                ("Le 1", None),
+                ("er", "superscript"),
+                (" mai, ", None),
+                ("https://example.com", "link"),
+                (" ou ", None),
+                ("04 92 43 00 00", "phone"),
+                (" (", None),
+                ("contact@example.com", "email"),
+                (").", None),
+            ),
+        )
+        self.assertEqual(split_font_styles("Messe"), (("Messe", None),))
+        self.assertEqual(split_font_styles("XXIIIe dimanche"), (("XXIII", None), ("e", "superscript"), (" dimanche", None)))
+
+    def test_fragments(self):
+        pdf = PDF()
+        pdf.add_page()
+        frags = pdf._preload_font_styles("Tél. : +33 4 92 43 00 00, 2e étage", False)
+        self.assertEqual([frag.string for frag in frags], ["Tél. : ", "+33 4 92 43 00 00", ", 2", "e", " étage"])
+        self.assertEqual(frags[1].link, "tel:+33492430000")
+        self.assertTrue(frags[1].graphics_state["underline"])
+        self.assertEqual(frags[3].graphics_state["char_vpos"], CharVPos.SUP)
+        self.assertEqual(frags[4].graphics_state["char_vpos"], frags[0].graphics_state["char_vpos"])
+
+
+class BulletinTests(PDFTestMixin, TestCase):
+    def render(self, bulletin: Bulletin, date: str) -> list[str]:
+        pdf = BulletinPDF()
+        pdf.render(bulletin.pk, date)
+        return "".join(page.extract_text() for page in PdfReader(BytesIO(pdf.output())).pages).splitlines()
+
+    def test_masses(self):
+        bulletin = Bulletin.objects.create(title="Messes", type=Bulletin.BulletinType.MASSES, days_after=1)
+        celebrant = Celebrant.objects.create(name="Père Martin", abbreviation="PM")
+        Date.objects.create(_title="Concert", start_date=dt.date(2026, 1, 10), _start_time=dt.time(20))
+        Date.objects.create(_title="Messe", start_date=dt.date(2026, 1, 11), _start_time=dt.time(10, 30), celebrant=celebrant)
+        lines = self.render(bulletin, "2026-01-10")
+        self.assertEqual(lines[2:5], ["du 10 au 11 janvier 2026", "Messes", "Jour Heure Célébration Célébrant"])
+        # The days without masses are kept, with their feasts
+        self.assertIn("Samedi 10 janvier", lines)
+        self.assertNotIn("Concert", "\n".join(lines))
+        self.assertIn("Dimanche 11 janvier", lines)
+        self.assertIn("Baptême", "\n".join(lines))
+        self.assertEqual(lines[-1], "10h30 Messe Père Martin")
+
+
+class HeaderTests(PDFTestMixin, TestCase):
+    def render(self) -> PdfReader:
+        pdf = PDF()
+        pdf.add_page()
+        pdf.draw_header("Titre")
+        return PdfReader(BytesIO(pdf.output()))
+
+    def test_cached_header(self):
+        self.assertIs(get_header()[2], get_header()[2])
+        for _ in range(2):
+            page = self.render().pages[0]
+            self.assertEqual(page.extract_text().splitlines()[:3], ["Paroisse de test", "Sous nos clochers", "Titre"])
+            self.assertEqual([image.image.size for image in page.images], [(20, 10)])
+
+    def test_config_change(self):
+        self.render()
+        # Saved in another process: only the data version tells it
+        Config.objects.filter(pk=self.config.pk).update(official_name="Nouveau nom")
+        self.assertEqual(self.render().pages[0].extract_text().splitlines()[0], "Paroisse de test")
+        bump_version(Config._meta.label)
+        self.assertEqual(self.render().pages[0].extract_text().splitlines()[0], "Nouveau nom")
+
+
+class PrerenderTests(PDFTestMixin, TestCase):
+    def test_retry(self):
+        # A fresh install, without any configuration yet
+        Config.objects.all().delete()
+
+        class Stop(Exception):
+            pass
+
+        sleeps = []
+
+        def sleep(interval):
+            sleeps.append(interval)
+            if len(sleeps) == 1:
+                self.create_config()
+            else:
+                raise Stop
+
+        stderr = StringIO()
+        with mock.patch("time.sleep", sleep), self.assertRaises(Stop):
+            call_command("prerender_bulletins", weeks=0, interval=60, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(sleeps, [60, 60])
+        self.assertIn("Config.DoesNotExist", stderr.getvalue())
+        # Rendered at the next check
+        key, _last_modified = FeuilleAnnonces.get_versioned_key(str(Week.get_current()))
+        self.assertTrue(FeuilleAnnonces.get_prerendered_path(key).exists())
+
+    def test_once(self):
+        Config.objects.all().delete()
+        with self.assertRaises(Config.DoesNotExist):
+            call_command("prerender_bulletins", weeks=0, stdout=StringIO())
@@ -1,11 +1,17 @@
 from django.urls import path
+from .pdfs.bulletin import BulletinPDF
 from .pdfs.feuille_annonces import FeuilleAnnonces
-from .views import edit, export
+from .views import bundle, calendar_object, edit, export, pdf_job
 
 urlpatterns = [
     path("edit", edit),
-    path("export", export),
+    path("export", export, name="export"),
+    path("export/<str:name>.ics", calendar_object, name="calendar-object"),
+    path("feuille-annonces/bundle", bundle),
     path("feuille-annonces/<str:week>", FeuilleAnnonces.as_view()),
     path("feuille-annonces", FeuilleAnnonces.as_view()),
+    path("bulletins/<int:pk>/<str:date>", BulletinPDF.as_view()),
+    path("bulletins/<int:pk>", BulletinPDF.as_view()),
+    path("pdf-jobs/<uuid:pk>", pdf_job, name="pdf-job"),
     path(".well-known/caldav", export),
 ]
@@ -3,11 +3,16 @@ import re
 from html import unescape
 
 from dateutil import rrule
+from dateutil.rrule import rrulestr
 from django.core.exceptions import ValidationError
 from django.utils.dateformat import format
 from django.utils.timezone import get_current_timezone, is_naive, make_aware
 
 
+# Titles of the masses and celebrations, which have a celebrant (same as `needsCelebrant` in edit.js)
+MASS_RE = re.compile(r"^(Messe|Célébration|Confession)s?\b")
+
+
 def striptags(value: str):
     value = str(value)
     value = re.sub(r"<!--.*?-->", "", value)
@@ -112,53 +117,69 @@ def _render_parts(all_parts, *, weekday=True, year=False, natural=False, natural
 
     return " ".join([part for part in (rendered.get("date"), rendered.get("time")) if part])
 
-def serialize_rruleset(rule_or_recurrence):
+# Parts of a rule that don't change the day of a yearly occurrence
+YEARLY_RULE_PARTS = {"FREQ", "INTERVAL", "BYMONTH", "BYMONTHDAY", "BYHOUR", "BYMINUTE", "BYSECOND", "WKST"}
+
+
+def get_yearly_month_day(text: str) -> tuple[int, int, dt.date | None] | None:
     """
-    Serialize a `Rule` or `Recurrence` instance into an RFC 2445 string.
+    If the rule only repeats every year on the same day, return `(month, day, first date)`
+    (the first date is None if the rule has no `DTSTART`), otherwise return None.
+
+    The text of the rule is read directly (like `rrulestr` does), the parsed rule is only used to validate it.
     """
-    if rule_or_recurrence is None:
+    try:
+        rrulestr(text, forceset=True)
+    except (KeyError, ValueError, TypeError):
         return None
 
-    def serialize_date(date):
-        if is_naive(date):
-            date = make_aware(date)
-        return date.astimezone(dt.timezone.UTC).strftime("%Y%m%dT%H%M%SZ")
-
-    def serialize_rule(rule):
-        parts = []
+    start = None
+    rules = []
+    for line in text.upper().split():
+        name, _, value = line.partition(":") if ":" in line else ("RRULE", "", line)
+        name = name.split(";")[0]
+        if name == "DTSTART":
+            start = dt.datetime.strptime(value[:8], "%Y%m%d").date()
+        elif name == "RRULE":
+            rules.append(value)
+        else:
+            # RDATE, EXRULE or EXDATE
+            return None
+    if len(rules) != 1:
+        return None
 
-        # Frequency is mandatory
-        parts.append(f"FREQ={Rule.frequencies[rule.freq]}")
+    parts = dict(part.partition("=")[::2] for part in rules[0].split(";"))
+    if parts.get("FREQ") != "YEARLY" or parts.get("INTERVAL", "1") != "1" or not parts.keys() <= YEARLY_RULE_PARTS:
+        return None
+    if "," in parts.get("BYMONTH", "") or "," in parts.get("BYMONTHDAY", ""):
+        return None
 
-        if rule.interval != 1:
-            parts.append(f"INTERVAL={int(rule.interval)}")
+    # Without BYMONTHDAY, the day (and the month if BYMONTH is also missing) is the one of DTSTART
+    day = int(parts["BYMONTHDAY"]) if "BYMONTHDAY" in parts else start and start.day
+    month = int(parts["BYMONTH"]) if "BYMONTH" in parts else "BYMONTHDAY" not in parts and start and start.month
+    if not month or not day or day < 0:
+        # The day would depend on the start of the requested range
+        return None
 
-        if rule.wkst:
-            wkst_val = getattr(rule.wkst, 'number', rule.wkst)
-            parts.append(f"WKST={Rule.weekdays[wkst_val]}")
+    return month, day, start
 
-        if rule.count is not None:
-            parts.append(f"COUNT={rule.count}")
-        elif rule.until is not None:
-            parts.append(f"UNTIL={serialize_date(rule.until)}")
 
-        if rule.byday:
-            days = []
-            for d in rule.byday:
-                d = to_weekday(d)
-                # Utilisation d'une f-string conditionnelle pour l'index
-                prefix = str(d.index) if d.index else ""
-                days.append(f"{prefix}{Rule.weekdays[d.number]}")
-            parts.append(f"BYDAY={','.join(days)}")
+def serialize_rruleset(rule_or_recurrence):
+    """
+    Serialize a `Rule` or `Recurrence` instance into an RFC 2445 string.
+    """
+    if rule_or_recurrence is None:
+        return None
 
-        # Traitement des autres paramètres (bymonth, bymonthday, etc.)
-        for param in [p for p in Rule.byparams if p != 'byday']:
-            value_list = getattr(rule, param, None)
-            if value_list:
-                val_str = ",".join(str(n) for n in value_list)
-                parts.append(f"{param.upper()}={val_str}")
+    def serialize_date(date):
+        if is_naive(date):
+            date = make_aware(date)
+        return date.astimezone(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
 
-        return ";".join(parts)
+    def serialize_rule(rule: rrule.rrule):
+        # dateutil writes the rule with its DTSTART (which is not part of it) and its UNTIL in local time
+        parts = str(rule).splitlines()[-1].removeprefix("RRULE:").split(";")
+        return ";".join(f"UNTIL={serialize_date(rule._until)}" if part.startswith("UNTIL=") else part for part in parts)
 
     # Validation
     try:
@@ -174,7 +195,7 @@ def serialize_rruleset(rule_or_recurrence):
             newobj.rdate(obj)
         else:
             newobj.rrule(obj)
-        newobj = obj
+        obj = newobj
 
     items = []
 
@@ -0,0 +1,52 @@
+"""
+Change counters of the models used in the rendered documents.
+
+Each save or deletion of one of the `VERSIONED_MODELS` increments its `DataVersion` row
+(in the database, so that all the processes see it). A rendered document can then be cached
+under the current data version: any change gives a new version, and thus a new cache key.
+"""
+
+import datetime as dt
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .models import DataVersion
+
+VERSIONED_MODELS = ("Bulletin", "Celebrant", "Config", "Date", "FixedFeast", "MovableFeast", "Recurrence")
+
+
+def bump_version(model_label: str):
+    """Increment the change counter of a model."""
+    updated = DataVersion.objects.filter(name=model_label).update(version=F("version") + 1, updated_at=now())
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(name=model_label, version=1)
+    except IntegrityError:
+        # Created by another process in the meantime
+        DataVersion.objects.filter(name=model_label).update(version=F("version") + 1, updated_at=now())
+
+
+def bump_data_version(sender, raw=False, **_kwargs):
+    """
+    Increments the change counter of a saved or deleted object.
+    """
+    if raw:
+        return
+    bump_version(sender._meta.label)
+
+
+def get_version(model_label: str) -> int:
+    """Return the change counter of one model."""
+    return DataVersion.objects.filter(name=model_label).values_list("version", flat=True).first() or 0
+
+
+def get_data_version() -> tuple[str, dt.datetime | None]:
+    """Return a token that changes with every modification, and the date of the last modification."""
+    rows = DataVersion.objects.order_by("name").values_list("name", "version", "updated_at")
+    token = hashlib.sha1(";".join(f"{name}:{version}" for name, version, _ in rows).encode()).hexdigest()
+    return token, max((updated_at for *_, updated_at in rows), default=None)
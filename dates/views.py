@@ -1,88 +1,161 @@
 import datetime
+import hashlib
+import re
+import time
 
-from django.http import HttpResponse
-from django.shortcuts import render
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from icalendar import Alarm, Calendar, Event
 
-from .models import Recurrence as StoredEvent, Date, Week
-from .pdfs.feuille_annonces import FeuilleAnnonces
+from .bundles import get_weeks, iter_rendered_weeks, iter_zip, render_merged
+from .caldav import get_calendar_data, get_etag, iter_resources, options, propfind, report
+from .ical import MAX_RANGE, MAX_TITLE_PATTERN, iter_calendar, iter_export_occurrences, iter_fragments, iter_series_fragments
+from .models import PdfJob, Week
+from .pdfs import serve_media_file
+from .utils import date_to_datetime
+from .versions import get_data_version
 
 # Create your views here.
 
+# Longest wait of the `pdf_job` view (it holds a worker)
+MAX_JOB_WAIT = 2
+
 @login_required
 def edit(request):
     return render(request, "dates/edit.html")
 
+@staff_member_required
+def bundle(request):
+    """
+    Return the bulletins of several weeks (`?start=` and `?end=`, the current week by default)
+    in one PDF, or in a ZIP file with `?format=zip`.
+    """
+    try:
+        start = datetime.date.fromisoformat(request.GET["start"]) if request.GET.get("start") else Week.get_current().start
+        end = datetime.date.fromisoformat(request.GET["end"]) if request.GET.get("end") else start
+        weeks = get_weeks(start, end)
+    except ValueError as err:
+        return HttpResponseBadRequest(str(err))
+
+    filename = f"feuilles-annonces-{weeks[0]}-{weeks[-1]}"
+    if request.GET.get("format") == "zip":
+        # Send each week as soon as it is rendered
+        response = StreamingHttpResponse(iter_zip(iter_rendered_weeks(weeks)), content_type="application/zip")
+        response["Content-Disposition"] = f'attachment; filename="{filename}.zip"'
+        return response
+
+    response = HttpResponse(render_merged(weeks), content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="{filename}.pdf"'
+    return response
+
+@require_http_methods(["GET"])
+def pdf_job(request, pk):
+    """
+    Return the file of a PDF job when it is rendered, or its status.
+
+    With `?wait=<seconds>` (MAX_JOB_WAIT at most, for the logged in users only), wait for the job
+    to finish before answering; the client should poll again if it is not done.
+    """
+    job = get_object_or_404(PdfJob, pk=pk)
+    try:
+        wait = min(float(request.GET.get("wait", 0)), MAX_JOB_WAIT) if request.user.is_authenticated else 0
+    except ValueError:
+        return HttpResponseBadRequest("Invalid wait")
+
+    deadline = time.monotonic() + wait
+    while job.status in (PdfJob.Status.PENDING, PdfJob.Status.RUNNING) and time.monotonic() < deadline:
+        time.sleep(0.5)
+        job.refresh_from_db()
+
+    if job.status == PdfJob.Status.DONE:
+        return serve_media_file(job.file.name)
+    return JsonResponse({"id": job.pk, "status": job.status, "error": job.error})
+
+@require_http_methods(["GET", "HEAD"])
+def calendar_object(request, name):
+    """Return one resource of the CalDAV collection (see `dates.caldav`)."""
+    ((_name, change, fragment),) = iter_resources([name], data=True)
+    if fragment is None:
+        raise Http404("No such event")
+
+    etag = get_etag(change)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(get_calendar_data(fragment), content_type="text/calendar; charset=utf-8")
+    response["ETag"] = etag
+    return response
+
 @csrf_exempt
-@require_http_methods(["GET", "PROPFIND"])
+@require_http_methods(["GET", "OPTIONS", "PROPFIND", "REPORT"])
 def export(request):
+    """
+    Return the calendar of the dates between `?start=` and `?end=` (the current week by default).
+
+    The recurrences are sent with their rules, or as separate occurrences with `?expand=1`
+    or when the feed is filtered: `?celebrant=<id>`, `?title=<text>` (searched in the titles, ignoring
+    the case; a regex for the logged in users), `?masses=1` (the masses and celebrations, for everyone)
+    and `?cancelled=0`.
+    The other methods give a CalDAV access to the calendar (see `dates.caldav`).
+    """
     print(request.headers["User-Agent"])
 
+    if request.method == "OPTIONS":
+        return options()
     if request.method == "PROPFIND":
-        return HttpResponse("""\
-<?xml version="1.0" encoding="utf-8"?>
-<D:multistatus xmlns:D="DAV:">
-    <D:response>
-        <D:href>/export</D:href>
-        <D:propstat>
-            <D:prop>
-                <D:displayname>Calendrier caté</D:displayname>
-                <D:resourcetype><D:collection/></D:resourcetype>
-            </D:prop>
-            <D:status>HTTP/1.1 200 OK</D:status>
-        </D:propstat>
-    </D:response>
-</D:multistatus>
-""", content_type="application/xml")
-
-    events = StoredEvent.objects.all()
-    occurrences: list[Date] = []
-    for event in events:
-        occurrences.extend(event.get_occurrences(Week.get_current()))
-
-    now = datetime.datetime.now()
-
-    cal = Calendar()
-    cal.calendar_name = "Calendrier caté"
-    cal.description = cal.calendar_name
-    cal.add("PRODID", f"-//Secteur paroissial de l'Embrunais et du Savinois//Espace caté {datetime.date.today().year} (https://github.com/lfavole/sitekt)//")  # FIXME
-    cal.add("VERSION", "2.0")
-    cal.add("X-WR-CALNAME", cal.calendar_name)
-    cal.add("X-WR-CALDESC", cal.calendar_name)
-
-    for i, occurrence in enumerate(occurrences, start=1):
-        event = Event()
-        event.add("summary", occurrence.event.title)
-        event.add("DTSTAMP", now)
-        event.uid = f"{occurrence.event.pk}_{i}"
-        event.start = occurrence.start
-
-        # Default to 1 hour duration, will not trigger on all-day events (1 hour < 1 day)
-        event.end = occurrence.end or occurrence.start + datetime.timedelta(hours=1)
-
-        # Add reminders
-        # Reminder 1: 1 day before at 5 PM
-        alarm1 = Alarm()
-        alarm1.add("action", "DISPLAY")
-        alarm1.add("description", f'"{occurrence.event.title}" commence demain' + (f" à {occurrence.start.time()}" if isinstance(occurrence.start, datetime.datetime) else ""))
-        # 1 day before at 5 PM
-        alarm1.TRIGGER = datetime.datetime.combine(occurrence.start, datetime.time(17, 0, 0)) - datetime.timedelta(days=1)
-        event.add_component(alarm1)
-
-        # Reminder 2: 15 minutes before (only if not an all-day event)
-        if isinstance(occurrence.start, datetime.datetime):
-            alarm2 = Alarm()
-            alarm2.add("action", "DISPLAY")
-            alarm2.add("description", f'"{occurrence.event.title}" commence dans 15 minutes')
-            # 15 minutes before
-            alarm2.add("trigger", occurrence.start - datetime.timedelta(minutes=15))
-            event.add_component(alarm2)
-
-        cal.add_component(event)
-
-    cal.add_missing_timezones()
-
-    return HttpResponse(cal.to_ical(), content_type="text/calendar")
+        return propfind(request)
+    if request.method == "REPORT":
+        return report(request)
+
+    week = Week.get_current()
+    try:
+        start = datetime.date.fromisoformat(request.GET["start"]) if request.GET.get("start") else week.start
+        end = datetime.date.fromisoformat(request.GET["end"]) if request.GET.get("end") else start + datetime.timedelta(days=6)
+    except ValueError as err:
+        return HttpResponseBadRequest(str(err))
+    if not start <= end <= start + MAX_RANGE:
+        return HttpResponseBadRequest(f"The end must be after the start and at most {MAX_RANGE.days} days after it")
+
+    pattern = request.GET.get("title", "")
+    if len(pattern) > MAX_TITLE_PATTERN:
+        return HttpResponseBadRequest(f"The title filter must be at most {MAX_TITLE_PATTERN} characters long")
+    try:
+        celebrant = int(request.GET["celebrant"]) if request.GET.get("celebrant") else None
+        # A regex can take exponential time (ReDoS), the anonymous users can only search a text
+        regex = request.user.is_authenticated
+        title = re.compile(pattern if regex else re.escape(pattern), 0 if regex else re.IGNORECASE) if pattern else None
+    except (ValueError, re.error) as err:
+        return HttpResponseBadRequest(str(err))
+    cancelled = request.GET.get("cancelled") != "0"
+    masses = request.GET.get("masses") == "1"
+    filters = {"celebrant": celebrant, "title": title, "cancelled": cancelled, "masses": masses}
+    # A filter can remove some occurrences of a recurrence, which its rule can't express
+    expand = request.GET.get("expand") == "1" or celebrant is not None or title is not None or not cancelled or masses
+
+    version, last_modified = get_data_version()
+    key = f"ical:{version}:{start}:{end}:{expand}:{celebrant}:{regex}:{pattern}:{cancelled}:{masses}"
+    etag = '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    # The DTSTAMPs must not change between two requests, otherwise the cached fragments can't be used
+    stamp = datetime.datetime.fromtimestamp(last_modified or 0, datetime.timezone.utc)
+    if not request.GET.get("start"):
+        # The same URL gives another week when the week changes, without any modification of the data
+        last_modified = max(last_modified or 0, int(date_to_datetime(week.start).timestamp()))
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if expand:
+            fragments = iter_fragments(iter_export_occurrences(start, end, **filters), version, stamp)
+        else:
+            fragments = iter_series_fragments(start, end, version, stamp)
+        # Each event is sent as soon as it is produced, the calendar is never held in memory
+        response = StreamingHttpResponse(iter_calendar(fragments), content_type="text/calendar")
+
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import datetime as dt
 import os
 from pathlib import Path
 
@@ -130,6 +131,15 @@ REST_FRAMEWORK = {
 CORS_ALLOW_ALL_ORIGINS = True
 
 
+# Occurrences of the recurrences
+
+# Number of compiled rules kept in memory
+RULE_CACHE_SIZE = 512
+# Range of the occurrences that are precomputed in the database
+OCCURRENCES_HISTORY = dt.timedelta(weeks=8)
+OCCURRENCES_HORIZON = dt.timedelta(days=548)  # 18 months
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -172,6 +182,13 @@ STATICFILES_DIRS = [BASE_DIR / "dates/static"]
 MEDIA_ROOT = BASE_DIR / "media/"
 MEDIA_URL = "media/"
 
+# Let nginx send the pre-rendered PDFs (see the prerender_bulletins command)
+USE_X_ACCEL_REDIRECT = os.environ.get("USE_X_ACCEL_REDIRECT", "0") == "1"
+
+# Number of processes that render the bulletins of several weeks at once, in each web worker
+# (kept small: every gunicorn worker starts its own pool)
+PDF_BUNDLE_WORKERS = int(os.environ.get("PDF_BUNDLE_WORKERS") or 2)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 